@@ -0,0 +1,93 @@
+# This module carries running totals forward from one hour to the next (helicity tracks, etc.),
+# so a product that covers the whole run doesn't have to re-read every previous hour on every frame.
+
+import numpy as np
+
+class RunningTrack:
+    # the track at hour t is the sum (or max composite) of a field from hour 0 through t.
+    # only the last few totals are held onto; if we're asked for an hour we haven't built yet (parallel worker, resumed run),
+    # we pick up from the closest earlier total we do have, or from hour 0 if there isn't one.
+    # field, if given, is a function (wrf_file, timestep, cache) -> array that's tracked instead of the raw variable
+    def __init__(self, variable, mode="sum", keep=2, field=None):
+        if mode not in ("sum", "max"):
+            raise ValueError(f"unknown track mode {mode}")
+        self.variable = variable
+        self.mode = mode
+        self.keep = keep
+        self.field = field
+        self.totals = {}
+
+    def total(self, wrf_file, timestep, cache, window=None):
+        if window is None:
+            return self._total(wrf_file, timestep, cache)
+        if self.mode == "sum":
+            # hours t-window+1 through t is just the difference of two running sums
+            self.keep = max(self.keep, window + 1)
+            total = self._total(wrf_file, timestep, cache)
+            if timestep - window < 0:
+                return total
+            return total - self._total(wrf_file, timestep - window, cache)
+        # max composites can't be un-done, so composite the window's hours straight from the cache
+        fields = [self._field(wrf_file, t, cache) for t in range(max(timestep - window + 1, 0), timestep + 1)]
+        return np.maximum.reduce(fields)
+
+    def _total(self, wrf_file, timestep, cache):
+        if timestep in self.totals:
+            return self.totals[timestep]
+        start = max((t for t in self.totals if t < timestep), default=None)
+        total = None if start is None else self.totals[start]
+        for t in range((start + 1) if start is not None else 0, timestep + 1):
+            field = self._field(wrf_file, t, cache)
+            if total is None:
+                total = field.copy()
+            elif self.mode == "sum":
+                total = total + field
+            else:
+                total = np.maximum(total, field)
+            self.totals[t] = total
+        for t in [t for t in self.totals if t <= timestep - self.keep]:
+            del self.totals[t]
+        return total
+
+    def _field(self, wrf_file, timestep, cache):
+        if self.field is not None:
+            return self.field(wrf_file, timestep, cache)
+        return cache.array(wrf_file, self.variable, timestep)
+
+# windows longer than this (the full-run change, etc.) still work, they just read their start hour instead of holding it
+MAX_WINDOW = 24
+
+class WindowedDifference:
+    # field(t) - field(t - window) for any number of windows, off of a ring buffer of the last few hours of one field.
+    # each hour is pulled from the cache once and kept until it falls out of the longest window we've been asked for,
+    # so 1hr/3hr/6hr/12hr products of the same field all share the same reads.
+    def __init__(self, variable, level=None, keep=2):
+        self.variable = variable
+        self.level = level
+        self.keep = keep
+        self.hours = {}
+
+    def field(self, wrf_file, timestep, cache):
+        if timestep in self.hours:
+            return self.hours[timestep]
+        # read-only, so it can be held onto without a copy
+        field = cache.array(wrf_file, self.variable, timestep, self.level)
+        # only hang onto the hours the next frames could still want, whichever direction we're being walked in
+        self.hours = {t: f for t, f in self.hours.items() if timestep - self.keep < t <= timestep}
+        self.hours[timestep] = field
+        return field
+
+    def change(self, wrf_file, timestep, cache, window=1):
+        # for accumulated fields, anything before the start of the run counts as zero (the change is just the total so far)
+        if window <= MAX_WINDOW:
+            self.keep = max(self.keep, window + 1)
+        now = self.field(wrf_file, timestep, cache)
+        if timestep - window < 0:
+            return now.copy()
+        if timestep - window in self.hours:
+            return now - self.hours[timestep - window]
+        return now - cache.array(wrf_file, self.variable, timestep - window, self.level)
+
+def get_window(cache, variable, level=None):
+    # one ring buffer per field (and level), shared by every product that differences it
+    return cache.stage(f"window_{variable}_{level}", lambda: WindowedDifference(variable, level))
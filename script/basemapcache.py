@@ -0,0 +1,111 @@
+# This module keeps pre-rendered copies of the static map layers (counties, states, borders, coastlines) on disk.
+# the layers are rasterized once per domain/layout/output size and every frame after that just pastes the pixels back in,
+# instead of cartopy re-projecting and drawing the 20m county shapes on every single map.
+
+import os
+import hashlib
+import numpy as np
+from PIL import Image, PngImagePlugin
+import matplotlib.artist
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "basemap_cache")
+
+# filled contours/pcolormesh sit at zorder 1, so anything below that goes in the underlay and everything else in the overlay
+DATA_ZORDER = 1
+
+def set_cache_dir(path):
+    global CACHE_DIR
+    CACHE_DIR = path
+
+def split_features(features):
+    underlay = [(name, kwargs) for name, kwargs in features if kwargs.get("zorder", 1.5) < DATA_ZORDER]
+    overlay = [(name, kwargs) for name, kwargs in features if kwargs.get("zorder", 1.5) >= DATA_ZORDER]
+    return underlay, overlay
+
+class LayerCache:
+    # rendered layers are keyed by everything that decides where their pixels land: the features, the projection and view limits
+    # (i.e. the domain's corners), the dpi, the canvas size and the axes' pixel box (which moves around with colorbars/tight_layout)
+    def __init__(self, add_feature):
+        self.add_feature = add_feature
+        self.layers = {}
+
+    def key(self, name, features, ax, renderer):
+        width, height = renderer.get_canvas_width_height()
+        parts = (
+            name,
+            repr(features),
+            ax.projection.proj4_init,
+            tuple(round(v, 6) for v in ax.get_xlim() + ax.get_ylim()),
+            round(ax.figure.dpi, 6),
+            (int(width), int(height)),
+            tuple(round(v, 4) for v in ax.bbox.bounds),
+        )
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def get(self, name, features, ax, renderer):
+        key = self.key(name, features, ax, renderer)
+        if key not in self.layers:
+            path = os.path.join(CACHE_DIR, f"{key}.png")
+            if os.path.exists(path):
+                with Image.open(path) as img:
+                    image = np.asarray(img.convert("RGBA"))
+                    x0, y0 = int(img.info["x0"]), int(img.info["y0"])
+            else:
+                image, x0, y0 = self.render(features, ax, renderer)
+                self.save(path, image, x0, y0)
+            self.layers[key] = (image, x0, y0)
+        return self.layers[key]
+
+    def render(self, features, ax, renderer):
+        # draw the features by themselves on a transparent figure laid out exactly like the real one, then cut out the axes box
+        width, height = (int(v) for v in renderer.get_canvas_width_height())
+        dpi = ax.figure.dpi
+        fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+        fig.patch.set_alpha(0)
+        bbox = ax.bbox
+        layer_ax = fig.add_axes([bbox.x0 / width, bbox.y0 / height, bbox.width / width, bbox.height / height], projection=ax.projection)
+        layer_ax.set_aspect("auto")
+        layer_ax.set_xlim(ax.get_xlim())
+        layer_ax.set_ylim(ax.get_ylim())
+        layer_ax.set_axis_off()
+        layer_ax.patch.set_visible(False)
+        for feature_name, kwargs in features:
+            self.add_feature(layer_ax, feature_name, kwargs)
+        canvas.draw()
+        buffer = np.asarray(canvas.buffer_rgba())
+        x0, x1 = max(int(np.floor(bbox.x0)), 0), min(int(np.ceil(bbox.x1)), width)
+        y0, y1 = max(int(np.floor(bbox.y0)), 0), min(int(np.ceil(bbox.y1)), height)
+        # the buffer's first row is the top of the figure
+        return buffer[height - y1:height - y0, x0:x1].copy(), x0, y0
+
+    def save(self, path, image, x0, y0):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        info = PngImagePlugin.PngInfo()
+        info.add_text("x0", str(x0))
+        info.add_text("y0", str(y0))
+        # several workers can build the same layer at once, write to a temp file so nobody reads a half-written png
+        tmp_path = f"{path}.{os.getpid()}.tmp.png"
+        Image.fromarray(image, "RGBA").save(tmp_path, pnginfo=info)
+        os.replace(tmp_path, path)
+
+class CachedLayer(matplotlib.artist.Artist):
+    # stands in for the feature artists on a GeoAxes, pasting the cached pixels in at draw time
+    def __init__(self, ax, name, features, cache, zorder):
+        super().__init__()
+        self.ax = ax
+        self.name = name
+        self.features = features
+        self.cache = cache
+        self.set_zorder(zorder)
+        self.set_in_layout(False)
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        image, x0, y0 = self.cache.get(self.name, self.features, self.ax, renderer)
+        gc = renderer.new_gc()
+        renderer.draw_image(gc, x0, y0, image[::-1])
+        gc.restore()
@@ -0,0 +1,65 @@
+# This module computes wrf-python's cape_2d (MCAPE/MCIN/LCL/LFC) in horizontal tiles on a process pool.
+# every column's parcel is lifted on its own, so the domain is cut into bands of rows, each worker reads and lifts its band
+# straight out of the wrfout, and the bands are stitched back into the same (4, south_north, west_east) field getvar gives.
+
+import atexit
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import xarray as xr
+from netCDF4 import Dataset
+from wrf import getvar, cape_2d, tk, destagger, default_fill
+
+# same constants wrf-python's getvar uses for cape_2d
+G = 9.81
+T_BASE = 300.0
+MISSING = default_fill(np.float64)
+CAPE_FIELDS = ["mcape", "mcin", "lcl", "lfc"]
+
+# per-process state: the pool in the process asking for cape, and the wrfout handles in the pool's workers
+_pool = None
+_pool_workers = 0
+_datasets = {}
+
+def cape_tile(wrf_path, timestep, rows):
+    # cape_2d for rows start:stop, filled with MISSING where wrf masks it
+    start, stop = rows
+    if wrf_path not in _datasets:
+        _datasets[wrf_path] = Dataset(wrf_path)
+    ncvars = _datasets[wrf_path].variables
+    def read(name):
+        return np.ma.getdata(ncvars[name][timestep, ..., start:stop, :])
+    full_p = read("P") + read("PB")
+    temp = tk(full_p, read("T") + T_BASE, meta=False)
+    height = destagger(read("PH") + read("PHB"), -3) / G
+    result = cape_2d(full_p * 0.01, temp, read("QVAPOR"), height, read("HGT"), read("PSFC") * 0.01, True, meta=False)
+    return np.ma.filled(result, MISSING)
+
+def get_pool(workers):
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+        atexit.register(_pool.shutdown)
+    return _pool
+
+def tile_rows(ny, tiles):
+    bands = np.array_split(np.arange(ny), min(tiles, ny))
+    return [(int(band[0]), int(band[-1]) + 1) for band in bands]
+
+def tiled_cape_2d(wrf_file, timestep, workers, tiles=None):
+    # a couple of tiles per worker so one slow band (deep convection, tall terrain) doesn't hold everybody up
+    ny = wrf_file.variables["HGT"].shape[-2]
+    rows = tile_rows(ny, tiles or workers * 2)
+    parts = get_pool(workers).map(cape_tile, repeat(wrf_file.filepath()), repeat(timestep), rows)
+    stitched = np.concatenate(list(parts), axis=1)
+    # dress it up like getvar's cape_2d so latlon_coords/to_np treat it the same
+    ter = getvar(wrf_file, "ter", timeidx=timestep)
+    coords = dict(ter.coords)
+    coords["mcape_cin_lcl_lfc"] = CAPE_FIELDS
+    attrs = dict(ter.attrs)
+    attrs.update({"description": "mcape ; mcin ; lcl ; lfc", "units": "J kg-1 ; J kg-1 ; m ; m", "MemoryOrder": "XY",
+                  "_FillValue": MISSING, "missing_value": MISSING})
+    return xr.DataArray(stitched, coords=coords, dims=("mcape_cin_lcl_lfc",) + ter.dims, attrs=attrs, name="cape_2d")
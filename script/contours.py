@@ -0,0 +1,90 @@
+# This module writes a map's filled contours out as GeoJSON, for the site to overlay as vector layers instead of showing the PNG.
+# it reuses the polygons the map's contourf already worked out (one path per band, in lon/lat), so nothing gets contoured twice,
+# splits each band's rings into polygons with their holes, thins them with Douglas-Peucker and writes one FeatureCollection per frame.
+
+import os
+import json
+import numpy as np
+from matplotlib import colors
+
+# default simplification tolerance, in degrees (about a kilometer)
+TOLERANCE = 0.01
+
+def simplify(ring, tolerance):
+    # Douglas-Peucker on an (n, 2) ring/line, keeping both ends
+    keep = np.zeros(len(ring), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(ring) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = ring[start], ring[end]
+        points = ring[start + 1:end]
+        ab = b - a
+        length = np.hypot(*ab)
+        if length == 0:
+            distance = np.hypot(*(points - a).T)
+        else:
+            distance = np.abs(ab[0] * (points[:, 1] - a[1]) - ab[1] * (points[:, 0] - a[0])) / length
+        i = int(np.argmax(distance))
+        if distance[i] > tolerance:
+            keep[start + 1 + i] = True
+            stack += [(start, start + 1 + i), (start + 1 + i, end)]
+    return ring[keep]
+
+def signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+
+def band_polygons(path, tolerance):
+    # contourpy hands each outer boundary (anticlockwise) over followed by its holes (clockwise), and matplotlib keeps that order.
+    # rings that fit inside the tolerance are dropped, along with the holes of any outer ring that is
+    polygons = []
+    outer = None
+    for ring in path.to_polygons(closed_only=True):
+        area = signed_area(ring)
+        if area > 0:
+            outer = None
+        elif area == 0 or outer is None:
+            continue
+        if np.all(np.ptp(ring, axis=0) < tolerance):
+            continue
+        ring = simplify(ring, tolerance)
+        if len(ring) < 4:
+            continue
+        if area > 0:
+            outer = [ring]
+            polygons.append(outer)
+        else:
+            outer.append(ring)
+    return polygons
+
+def band_limits(contour_set):
+    # (lower, upper) for each filled band, None for the open ends of extended bands
+    levels = [float(level) for level in contour_set.levels]
+    lowers, uppers = levels[:-1], levels[1:]
+    if contour_set.extend in ("both", "min"):
+        lowers, uppers = [None] + lowers, [levels[0]] + uppers
+    if contour_set.extend in ("both", "max"):
+        lowers, uppers = lowers + [levels[-1]], uppers + [None]
+    return list(zip(lowers, uppers))
+
+def write_contours(path, contour_set, label=None, tolerance=TOLERANCE, digits=4):
+    features = []
+    for (lower, upper), band, color in zip(band_limits(contour_set), contour_set.get_paths(), contour_set.get_facecolor()):
+        polygons = band_polygons(band, tolerance)
+        if not polygons:
+            continue
+        coordinates = [[np.round(ring, digits).tolist() for ring in polygon] for polygon in polygons]
+        features.append({
+            "type": "Feature",
+            "properties": {"lower": lower, "upper": upper, "color": colors.to_hex(color, keep_alpha=True)},
+            "geometry": {"type": "MultiPolygon", "coordinates": coordinates},
+        })
+    collection = {"type": "FeatureCollection", "features": features}
+    if label is not None:
+        collection["label"] = label
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(json.dumps(collection, separators=(",", ":")))
@@ -0,0 +1,59 @@
+# This module keeps our most expensive diagnostics (cape_2d, cloudfrac, the upper level stack, streamlines, the kuchera ratio) on disk between runs.
+# each field/hour/level is its own .npy file, written the first time anything computes it and memory-mapped back in after that,
+# so a rerun after a crash, or one module re-rendered with --run_flags, doesn't redo them. a manifest ties the folder to one wrfout
+# (its size, mtime and START_DATE) and everything in it is thrown out if the wrfout it was built from has changed.
+
+import os
+import json
+import numpy as np
+
+# the fields worth a trip to disk. eth only gets used through the level stack, so it's covered by that
+STORED_NAMES = ("cape_2d", "cloudfrac", "level_stack", "streamlines", "kuchera_ratio")
+MANIFEST = "manifest.json"
+
+def wrfout_identity(wrf_path, wrf_file):
+    stat = os.stat(wrf_path)
+    return {"wrfout": os.path.basename(wrf_path), "size": stat.st_size, "mtime": stat.st_mtime, "start_date": str(wrf_file.START_DATE)}
+
+class DerivedStore:
+    def __init__(self, folder, wrf_path, wrf_file, names=STORED_NAMES):
+        self.folder = folder
+        self.names = tuple(names)
+        os.makedirs(folder, exist_ok=True)
+        identity = wrfout_identity(wrf_path, wrf_file)
+        manifest_path = os.path.join(folder, MANIFEST)
+        manifest = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        if manifest != identity:
+            if manifest is not None:
+                print(f"derived store in {folder} was built from a different wrfout, clearing it")
+            for name in os.listdir(folder):
+                if name.endswith((".npy", ".tmp")):
+                    os.remove(os.path.join(folder, name))
+            with open(manifest_path, "w") as f:
+                json.dump(identity, f, indent=2)
+
+    def path(self, name, timestep, level, masked=False):
+        return os.path.join(self.folder, f"{name}_{level}_{timestep}{'.masked' if masked else ''}.npy")
+
+    def load(self, name, timestep, level=None):
+        # a read-only memmap, or None if nobody has worked it out yet. masked fields are stored with nan where the mask was
+        path = self.path(name, timestep, level)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r")
+        path = self.path(name, timestep, level, masked=True)
+        if os.path.exists(path):
+            return np.ma.masked_invalid(np.load(path, mmap_mode="r"), copy=False)
+        return None
+
+    def save(self, name, timestep, level, field):
+        masked = np.ma.isMaskedArray(field)
+        array = np.ma.filled(field.astype(np.result_type(field.dtype, np.float32)), np.nan) if masked else np.asarray(field)
+        path = self.path(name, timestep, level, masked)
+        # write under a temporary name first, so a render worker never maps a half-written file
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            np.save(f, array)
+        os.replace(temp, path)
@@ -0,0 +1,70 @@
+# This module writes the field behind each map as a small quantized binary the site can colorize, zoom and probe itself.
+# a frame file is self-describing: b"UGAQ", a uint32 header length, a JSON header (dtype, shape, scale/offset, the code used for
+# missing values, and the style the PNG was drawn with), then the values as little-endian uint8/uint16 codes, zlib-deflated
+# (DecompressionStream("deflate") in the browser). value = code * scale + offset. the grid's lat/lons go in grid.bin the same way, as float32.
+
+import os
+import json
+import zlib
+import struct
+import numpy as np
+from matplotlib import colors
+from matplotlib.contour import ContourSet
+
+MAGIC = b"UGAQ"
+VERSION = 1
+# the top code of each type marks missing values
+MISSING = {"uint8": 255, "uint16": 65535}
+
+def hex_colors(rgba):
+    return [colors.to_hex(c, keep_alpha=True) for c in np.atleast_2d(rgba)]
+
+def describe_style(artist):
+    # the levels/colors a map's filled contours or mesh were drawn with, as JSON-able bits.
+    # contourf bands that extend past the levels get their own color first (below) and/or last (above)
+    if isinstance(artist, ContourSet):
+        return {"type": "bands", "levels": [float(level) for level in artist.levels], "colors": hex_colors(artist.get_facecolor()), "extend": artist.extend}
+    cmap, norm = artist.get_cmap(), artist.norm
+    if isinstance(norm, colors.BoundaryNorm):
+        codes = np.arange(cmap.N)
+        return {"type": "bands", "levels": [float(b) for b in norm.boundaries], "colors": hex_colors(cmap(codes)), "extend": "neither"}
+    style = {"type": "ramp", "vmin": float(norm.vmin), "vmax": float(norm.vmax), "colors": hex_colors(cmap(np.linspace(0, 1, 256)))}
+    if isinstance(norm, colors.TwoSlopeNorm):
+        style["vcenter"] = float(norm.vcenter)
+    return style
+
+def quantize(field):
+    # smallest code type that keeps the field: uint8 for small integer fields (ptype, etc.), uint16 (1/65534 of the range) otherwise
+    values = np.ma.filled(np.ma.masked_invalid(np.ma.asarray(field, dtype=np.float64)), np.nan)
+    finite = np.isfinite(values)
+    lo, hi = (float(values[finite].min()), float(values[finite].max())) if finite.any() else (0.0, 0.0)
+    integral = finite.any() and np.all(values[finite] == np.round(values[finite]))
+    dtype = "uint8" if integral and hi - lo < MISSING["uint8"] else "uint16"
+    scale = 1.0 if integral or hi == lo else (hi - lo) / (MISSING[dtype] - 1)
+    codes = np.full(values.shape, MISSING[dtype], dtype=dtype)
+    codes[finite] = np.round((values[finite] - lo) / scale)
+    return codes, scale, lo, dtype
+
+def write_blob(path, header, payload):
+    header = json.dumps(header, separators=(",", ":")).encode()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header + zlib.compress(payload, 6))
+    os.replace(temp, path)
+
+def write_frame(path, field, artist=None, label=None):
+    codes, scale, offset, dtype = quantize(field)
+    header = {"version": VERSION, "dtype": dtype, "shape": list(codes.shape), "scale": scale, "offset": offset, "missing": MISSING[dtype]}
+    if artist is not None:
+        header["style"] = describe_style(artist)
+    if label is not None:
+        header["label"] = label
+    write_blob(path, header, codes.astype(np.dtype(dtype).newbyteorder("<")).tobytes())
+
+def write_grid(path, lats, lons):
+    # shared by every frame of the run, so written once
+    if os.path.exists(path):
+        return
+    grid = np.stack([np.asarray(lats, dtype="<f4"), np.asarray(lons, dtype="<f4")])
+    write_blob(path, {"version": VERSION, "dtype": "float32", "shape": list(grid.shape), "fields": ["lat", "lon"]}, grid.tobytes())
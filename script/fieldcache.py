@@ -0,0 +1,165 @@
+# This module keeps the wrf-python diagnostics we pull for each timestep around, so the same field is only computed once.
+# fields are keyed by (variable, timestep, level, units) and evicted least-recently-used once the cache goes over its memory limit.
+# array() hands out plain read-only float32 arrays for plotting; raw wrfout variables read that way never become DataArrays at all.
+
+from collections import OrderedDict
+import numpy as np
+from wrf import getvar, interplevel, to_np
+from levelstack import LEVELS, LEVEL_VARIABLES, build_level_stack
+from capetiles import tiled_cape_2d
+
+# stands in for the units slot of the key for fields cached by array()
+ARRAY = "float32"
+
+def as_float32(field):
+    # float32 without a copy where it already is, read-only so nobody converts a cached field in place by accident
+    if np.ma.isMaskedArray(field) and not np.ma.is_masked(field):
+        field = np.ma.getdata(field)
+    field = field.astype(np.float32, copy=False)
+    field.flags.writeable = False
+    return field
+
+def convert(field, scale=1.0, offset=0.0):
+    # field * scale + offset as one new float32 array, instead of a float64 temporary per operation
+    out = np.multiply(field, scale, dtype=np.float32)
+    if offset:
+        out += offset
+    return out
+
+class FieldCache:
+    def __init__(self, max_mb=2048, levels=LEVELS, level_variables=LEVEL_VARIABLES, cape_workers=1):
+        self.max_bytes = max_mb * 1024 * 1024
+        self.cape_workers = cape_workers
+        # set to a prefetch.Prefetcher to have each hour's raw variables read ahead in the background
+        self.prefetcher = None
+        # set to a derivedstore.DerivedStore to keep the expensive diagnostics on disk between runs
+        self.store = None
+        self.levels = tuple(levels)
+        self.level_variables = tuple(level_variables)
+        self.fields = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stages = {}
+
+    def get(self, wrf_file, variable, timestep, level=None, units=None):
+        key = (variable, timestep, level, units)
+        if key in self.fields:
+            return self._hit(key)
+        if level and not units and level in self.levels and variable in self.level_variables:
+            # every configured variable/level comes out of one batched interp per timestep
+            # the stack's level slot names what's in it, so a store built for other levels/variables isn't read back
+            stack_tag = "-".join(map(str, self.levels)) + "_" + "-".join(self.level_variables)
+            stack = self.derived("level_stack", timestep, lambda: build_level_stack(wrf_file, timestep, self, self.levels, self.level_variables), stack_tag)
+            # levels below the ground (or above the model top) come back masked, the way interplevel hands them over
+            return np.ma.masked_invalid(stack[self.level_variables.index(variable), self.levels.index(level)], copy=False)
+        self.misses += 1
+        if level:
+            # anything outside the level stack gets interpolated on its own off of the cached 3d field and pressure
+            field = interplevel(self.get(wrf_file, variable, timestep, units=units), self.get(wrf_file, "pressure", timestep), level)
+        elif units:
+            field = getvar(wrf_file, variable, timeidx=timestep, units=units, cache=self.raw(timestep))
+        else:
+            field = self._stored(variable, timestep, None, lambda: self._compute(wrf_file, variable, timestep))
+        self._put(key, field)
+        return field
+
+    def _compute(self, wrf_file, variable, timestep):
+        if variable == "cape_2d" and self.cape_workers > 1:
+            # our heaviest 2d diagnostic, so it gets split up into tiles across processes (see capetiles.py)
+            return tiled_cape_2d(wrf_file, timestep, self.cape_workers)
+        return getvar(wrf_file, variable, timeidx=timestep, cache=self.raw(timestep))
+
+    def _stored(self, name, timestep, level, compute):
+        # anything the on-disk store keeps comes back from there (as a memmap, without metadata) if an earlier run worked it out
+        if self.store is None or name not in self.store.names:
+            return compute()
+        field = self.store.load(name, timestep, level)
+        if field is None:
+            field = compute()
+            self.store.save(name, timestep, level, to_np(field))
+        return field
+
+    def array(self, wrf_file, variable, timestep, level=None):
+        # the field as a plain read-only float32 array. raw wrfout variables come straight out of the file (or the prefetcher)
+        key = (variable, timestep, level, ARRAY)
+        if key in self.fields:
+            return self._hit(key)
+        if level is not None or variable not in wrf_file.variables:
+            # diagnostics are already cached as DataArrays, so this is a view of that (or a float32 copy of a float64 one)
+            return as_float32(to_np(self.get(wrf_file, variable, timestep, level)))
+        self.misses += 1
+        raw = self.raw(timestep)
+        field = as_float32(to_np(raw[variable]) if raw is not None and variable in raw else wrf_file.variables[variable][timestep])
+        self._put(key, field)
+        return field
+
+    def latlon(self, wrf_file):
+        # the grid's lats/lons, read once and shared read-only by every frame (the domain doesn't move)
+        return self.stage("latlon", lambda: (as_float32(wrf_file.variables["XLAT"][0]), as_float32(wrf_file.variables["XLONG"][0])))
+
+    def derived(self, name, timestep, compute, level=None):
+        # for anything we build ourselves off of other fields (kuchera ratio, etc.)
+        key = (name, timestep, level, None)
+        if key in self.fields:
+            return self._hit(key)
+        self.misses += 1
+        field = self._stored(name, timestep, level, compute)
+        self._put(key, field)
+        return field
+
+    def raw(self, timestep):
+        # this hour's raw wrfout variables from the prefetcher, in the form getvar's cache argument takes. None means read from the file
+        if self.prefetcher is None:
+            return None
+        key = ("raw", timestep, None, None)
+        if key in self.fields:
+            self.fields.move_to_end(key)
+            return self.fields[key]
+        fields = self.prefetcher.raw(timestep)
+        if fields is not None:
+            self._put(key, fields)
+        return fields
+
+    def stage(self, name, factory):
+        # long-lived helpers that carry state between timesteps (running tracks, etc.). these aren't evicted.
+        if name not in self.stages:
+            self.stages[name] = factory()
+        return self.stages[name]
+
+    def drop_timestep(self, timestep):
+        for key in [key for key in self.fields if key[1] == timestep]:
+            self.nbytes -= self._size(self.fields.pop(key))
+
+    def timestep_bytes(self, timestep):
+        return sum(self._size(field) for key, field in self.fields.items() if key[1] == timestep)
+
+    def clear(self):
+        self.fields.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total else 0
+        return f"{self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), {len(self.fields)} fields / {self.nbytes / 1024 / 1024:.0f} MB held"
+
+    def _hit(self, key):
+        self.hits += 1
+        self.fields.move_to_end(key)
+        return self.fields[key]
+
+    def _put(self, key, field):
+        self.fields[key] = field
+        self.nbytes += self._size(field)
+        # never evict the field we just added, even if it's bigger than the limit on its own
+        while self.nbytes > self.max_bytes and len(self.fields) > 1:
+            _, old = self.fields.popitem(last=False)
+            self.nbytes -= self._size(old)
+
+    @staticmethod
+    def _size(field):
+        if isinstance(field, dict):
+            field = list(field.values())
+        if isinstance(field, (tuple, list)):
+            return sum(getattr(f, "nbytes", 0) for f in field)
+        return getattr(field, "nbytes", 0)
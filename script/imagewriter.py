@@ -0,0 +1,112 @@
+# This module takes the encoding and writing of finished maps off of the render loop.
+# a frame's Agg buffer is grabbed right after its one draw, cropped to the figure's tight bounding box (measured off of that same
+# draw, instead of savefig's bbox_inches='tight' drawing everything twice), and handed to a small thread pool that encodes it while
+# the next frame renders. pillow lets go of the GIL while it compresses, so the threads really do run alongside matplotlib.
+# a failed write never surfaces in some later frame's call: flush() hands back exactly which files didn't make it.
+
+import io
+import os
+import atexit
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+# format -> (file extension, default level). png: zlib level 0-9, png8: the same on a 256 color palette, webp: quality 0-100
+FORMATS = {"png": ("png", 6), "png8": ("png", 9), "webp": ("webp", 90)}
+DPI = 125
+PAD_INCHES = 0.1
+
+# per-process state, set up by configure()
+_formats = {None: ("png", None)}
+_threads = 2
+_pool = None
+# (path, future) for every image handed over and not yet checked, and {path: error} for the ones that failed
+_pending = deque()
+_failed = {}
+
+def parse_formats(spec):
+    # "png", or "png:3,ptype=png8,comp_reflectivity=webp:85" -> {None: default, product: (format, level)}
+    formats = {None: ("png", None)}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        product, _, value = part.rpartition("=")
+        fmt, _, level = value.partition(":")
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown image format {fmt} (pick from {', '.join(FORMATS)})")
+        formats[product or None] = (fmt, int(level) if level else None)
+    return formats
+
+def configure(spec=None, threads=2):
+    global _formats, _threads
+    _formats = parse_formats(spec)
+    _threads = max(1, threads)
+
+def extension(product):
+    return FORMATS[_formats.get(product, _formats[None])[0]][0]
+
+def encode(path, rgba, fmt, level):
+    level = FORMATS[fmt][1] if level is None else level
+    image = Image.fromarray(rgba, "RGBA")
+    temp = f"{path}.tmp"
+    if fmt == "webp":
+        image.save(temp, "WEBP", quality=level, method=4)
+    else:
+        image = image.convert("RGB")
+        if fmt == "png8":
+            image = image.quantize(256, method=Image.Quantize.FASTOCTREE)
+        image.save(temp, "PNG", compress_level=level)
+    os.replace(temp, path)
+
+def capture(fig, dpi=DPI):
+    # one draw at the output dpi, cropped to the box bbox_inches='tight' would have used. measuring it doesn't draw anything again
+    original = fig.dpi
+    fig.dpi = dpi
+    try:
+        fig.canvas.draw()
+        bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(PAD_INCHES)
+        buffer = np.asarray(fig.canvas.buffer_rgba())
+        height, width = buffer.shape[:2]
+        # sized the way savefig sizes a tight canvas (truncated), from the box's rounded corner
+        x0, y0 = int(round(bbox.x0 * dpi)), int(round(bbox.y0 * dpi))
+        x1, y1 = x0 + int(bbox.width * dpi), y0 + int(bbox.height * dpi)
+        if x0 >= 0 and y0 >= 0 and x1 <= width and y1 <= height:
+            # the renderer reuses its buffer, so the crop has to be a copy
+            return buffer[height - y1:height - y0, x0:x1].copy()
+    finally:
+        fig.dpi = original
+    # something (a long title, etc.) hangs off the figure, past what got drawn, so let savefig grow the canvas the usual way
+    with io.BytesIO() as png:
+        fig.savefig(png, format="png", bbox_inches="tight", dpi=dpi)
+        png.seek(0)
+        return np.asarray(Image.open(png).convert("RGBA"))
+
+def save_frame(fig, path, product):
+    # path without an extension. returns the file that will be written
+    global _pool
+    fmt, level = _formats.get(product, _formats[None])
+    path = f"{path}.{FORMATS[fmt][0]}"
+    rgba = capture(fig)
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=_threads)
+        atexit.register(flush)
+    # keep a couple of frames per thread in flight at most, they're several MB each
+    while len(_pending) >= 2 * _threads:
+        _check(*_pending.popleft())
+    _pending.append((path, _pool.submit(encode, path, rgba, fmt, level)))
+    return path
+
+def _check(path, future):
+    # waits for one image, and notes it down (for flush to hand back) if it didn't get written
+    try:
+        future.result()
+    except Exception as e:
+        _failed[path] = f"{type(e).__name__}: {e}"
+        print(f"error writing {path}: {_failed[path]}")
+
+def flush():
+    # wait for everything handed over so far. returns {path: error} for the images that failed since the last flush
+    global _failed
+    while _pending:
+        _check(*_pending.popleft())
+    failed, _failed = _failed, {}
+    return failed
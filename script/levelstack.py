@@ -0,0 +1,48 @@
+# This module interpolates every upper air variable to every pressure level we plot in one pass.
+# the vertical index/weights against pressure are worked out once per timestep and applied to all of the variables,
+# instead of each product running its own wrf.interplevel search through the 3d pressure column.
+
+import numpy as np
+from wrf import to_np
+
+LEVELS = (925, 850, 700, 500, 300)
+LEVEL_VARIABLES = ("tc", "eth", "rh", "td", "ua", "va", "z")
+
+def level_weights(pressure, levels):
+    # pressure is (bottom_top, south_north, west_east) and decreases with height.
+    # returns the index of the model level just below each pressure level, the weight on that level, and where the level is inside the column.
+    # same linear-in-pressure interp as wrf's interplevel, anything above/below the model column is left missing.
+    pressure = np.asarray(pressure)
+    nz = pressure.shape[0]
+    lower = np.empty((len(levels),) + pressure.shape[1:], dtype=np.intp)
+    weight = np.empty((len(levels),) + pressure.shape[1:], dtype=pressure.dtype)
+    valid = np.empty((len(levels),) + pressure.shape[1:], dtype=bool)
+    for i, level in enumerate(levels):
+        k = np.clip(np.count_nonzero(pressure > level, axis=0) - 1, 0, nz - 2)
+        p_lower = np.take_along_axis(pressure, k[None], axis=0)[0]
+        p_upper = np.take_along_axis(pressure, k[None] + 1, axis=0)[0]
+        valid[i] = (p_lower > level) & (p_upper < level)
+        lower[i] = k
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight[i] = (level - p_upper) / (p_lower - p_upper)
+    return lower, weight, valid
+
+def apply_weights(field, lower, weight, valid):
+    # field is (bottom_top, south_north, west_east) -> (level, south_north, west_east)
+    field = np.asarray(field)
+    below = np.take_along_axis(field, lower, axis=0)
+    above = np.take_along_axis(field, lower + 1, axis=0)
+    out = above + weight * (below - above)
+    out[~valid] = np.nan
+    return out
+
+def build_level_stack(wrf_file, timestep, cache, levels=LEVELS, variables=LEVEL_VARIABLES):
+    # compact (variable, level, south_north, west_east) array for the upper air products to read from
+    lower, weight, valid = level_weights(to_np(cache.get(wrf_file, "pressure", timestep)), levels)
+    stack = None
+    for i, variable in enumerate(variables):
+        field = to_np(cache.get(wrf_file, variable, timestep))
+        if stack is None:
+            stack = np.empty((len(variables), len(levels)) + field.shape[1:], dtype=np.result_type(field.dtype, weight.dtype))
+        stack[i] = apply_weights(field, lower, weight, valid)
+    return stack
@@ -0,0 +1,113 @@
+# This module remembers what went into every frame we've written for a run, so a rerun only redraws the frames that would change.
+# a frame's fingerprint covers the wrfout it came from (size, mtime, START_DATE), the run options and config (stations, products,
+# levels) that change what gets drawn, the frame itself (product, variable, level, hour, station) and the source of the module that
+# draws it plus every module of ours that one imports. fix a colorbar in weathermaps.py and every map is redrawn, but the skewts and
+# special plots are left alone. a frame whose file has gone missing since is redrawn whatever its fingerprint says.
+
+import os
+import ast
+import json
+import hashlib
+import functools
+import imagewriter
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# which module draws each kind of frame
+FRAME_MODULES = {
+    "map": "weathermaps",
+    "4panel_cloudcover": "special",
+    "4panel_ptype": "special",
+    "24hr_change": "special",
+    "skewt": "skewt",
+}
+
+@functools.lru_cache(maxsize=None)
+def local_imports(module):
+    # our own modules that module imports, found by reading its source (nothing gets imported)
+    with open(os.path.join(SCRIPT_DIR, f"{module}.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    return sorted(name for name in names if os.path.exists(os.path.join(SCRIPT_DIR, f"{name}.py")))
+
+@functools.lru_cache(maxsize=None)
+def code_version(module):
+    # hash of module's source and everything of ours it pulls in, however deep
+    seen, todo = set(), [module]
+    while todo:
+        name = todo.pop()
+        if name not in seen:
+            seen.add(name)
+            todo.extend(local_imports(name))
+    digest = hashlib.sha1()
+    for name in sorted(seen):
+        with open(os.path.join(SCRIPT_DIR, f"{name}.py"), "rb") as f:
+            digest.update(name.encode() + b"\0" + f.read())
+    return digest.hexdigest()
+
+def frame_files(frame, run_path, forecast_times, init_dt, map_output="png"):
+    # the files a frame writes under the run's folder. geojson-only runs still write PNGs for the raster maps, so either one will do there
+    kind, name, t, _ = frame
+    f_hour = int(round((forecast_times[t] - init_dt).total_seconds() / 3600))
+    if kind == "map":
+        image = os.path.join(run_path, name, f"hour_{f_hour}.{imagewriter.extension(name)}")
+        return [image] if map_output != "geojson" else [os.path.join(run_path, name, f"hour_{f_hour}.geojson"), image]
+    if kind == "24hr_change":
+        return [os.path.join(run_path, "24hr_change", "24hr_change.png")]
+    if kind == "skewt":
+        return [os.path.join(run_path, "skewt", name, f"hour_{f_hour}.png")]
+    return [os.path.join(run_path, name, f"hour_{f_hour}.png")]
+
+def frame_key(frame):
+    kind, name, t, _ = frame
+    return f"{kind}/{name}/{t}"
+
+class OutputManifest:
+    # frames are (kind, name, timestep, extra), the same tuples the render pool takes
+    # outputs, if given, is a function frame -> the files it writes, any one of which counts as the frame being on disk
+    def __init__(self, path, inputs, force=False, outputs=None):
+        self.path = path
+        self.inputs = inputs
+        self.force = force
+        self.outputs = outputs
+        self.frames = {}
+        self.skipped = 0
+        self.rendered = 0
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.frames = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"warning: couldn't read frame manifest {path} ({e}), rendering everything")
+
+    def fingerprint(self, frame):
+        parts = [self.inputs, code_version(FRAME_MODULES[frame[0]]), repr(frame)]
+        return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def fresh(self, frame):
+        # True (and counted as skipped) if the last run already drew this frame from the same inputs, and it's still there
+        if self.force or self.frames.get(frame_key(frame)) != self.fingerprint(frame):
+            return False
+        if self.outputs is None or any(os.path.exists(path) for path in self.outputs(frame)):
+            self.skipped += 1
+            return True
+        return False
+
+    def record(self, frame):
+        self.frames[frame_key(frame)] = self.fingerprint(frame)
+        self.rendered += 1
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp = f"{self.path}.tmp"
+        with open(temp, "w") as f:
+            json.dump(self.frames, f, indent=1, sort_keys=True)
+        os.replace(temp, self.path)
+
+    def summary(self):
+        return f"{self.rendered} frames rendered, {self.skipped} unchanged frames skipped" + (" (--force)" if self.force else "")
@@ -2,29 +2,24 @@
 
 import matplotlib.pyplot as plt
 import matplotlib.patheffects as path_effects
-from wrf import getvar, ll_to_xy, to_np
 import numpy as np
 import os
+from stations import StationIndex
+from pointseries import extract_point_series
 
-def plot_meteogram(wrf_file, airport, coords, output_path, forecast_times, wrfhours, run_time):
-    x, y = ll_to_xy(wrf_file, coords[0], coords[1])
+def plot_meteogram(wrf_file, airport, coords, output_path, forecast_times, wrfhours, run_time, station_index=None, series=None):
+    # series is this airport's table from pointseries.extract_point_series, pulled here if the caller didn't already
+    if series is None:
+        if station_index is None:
+            station_index = StationIndex(wrf_file)
+        series = extract_point_series(wrf_file, {airport: coords}, station_index)[airport]
     hours = np.arange(1, wrfhours)
     times = [forecast_times[t].strftime('%H UTC') for t in hours]
-    u_wind = [to_np(getvar(wrf_file, "U10", timeidx=t)[y, x]) for t in hours]
-    v_wind = [to_np(getvar(wrf_file, "V10", timeidx=t)[y, x]) for t in hours]
-    temperatures = []
-    dewpoints = []
-    pressures = []
-    for t in hours:
-        t_data = getvar(wrf_file, "T2", timeidx=t)[y, x].values
-        td_data = getvar(wrf_file, "td2", timeidx=t)[y, x].values
-        pressure_data = getvar(wrf_file, "AFWA_MSLP", timeidx=t)[y, x].values
-        t_f = (t_data - 273.15) * 9/5 + 32
-        td_f = to_np(td_data) * 9/5 + 32
-        pressure_mb = to_np(pressure_data) / 100
-        temperatures.append(t_f)
-        dewpoints.append(td_f)
-        pressures.append(pressure_mb)
+    u_wind = series["u10"][1:wrfhours]
+    v_wind = series["v10"][1:wrfhours]
+    temperatures = series["temp_f"][1:wrfhours]
+    dewpoints = series["dewpoint_f"][1:wrfhours]
+    pressures = series["mslp_mb"][1:wrfhours]
     fig, ax1 = plt.subplots(figsize=(10, 6))
     maxtemp_x = np.argmax(temperatures)
     mintemp_x = np.argmin(temperatures)
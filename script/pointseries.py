@@ -0,0 +1,38 @@
+# This module pulls the surface time series at every station out of the wrfout in one go for textgen and the meteograms.
+# each variable is read once for all timesteps and every station's column is gathered out of it together,
+# instead of reading a full 2d field per hour per station just to keep one grid point.
+
+import numpy as np
+from wrf import getvar, to_np, ALL_TIMES
+
+CARDINALS = np.array(['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW'])
+
+def deg_to_cardinals(deg):
+    # same 22.5 degree bins as textgen.deg_to_cardinal, for a whole array at once (nan falls through to NNW like it does there)
+    idx = ((np.asarray(deg, dtype=np.float64) + 11.25) // 22.5) % 16
+    return CARDINALS[np.where(np.isfinite(idx), idx, 15).astype(int)]
+
+def extract_point_series(wrf_file, stations, station_index):
+    # stations is {name: (lat, lon)}. returns {name: {column: array over timesteps}}
+    names = list(stations)
+    coords = [stations[name] for name in names]
+    # squeeze=False keeps the Time dimension around even for a single-hour file
+    def gather(variable, **kwargs):
+        return station_index.nearest(to_np(getvar(wrf_file, variable, timeidx=ALL_TIMES, squeeze=False, **kwargs)), coords)
+    t2 = gather("T2")
+    td2 = gather("td2")
+    wspd_wdir = gather("wspd_wdir10", units="mph")
+    mslp = gather("AFWA_MSLP")
+    u10 = gather("U10")
+    v10 = gather("V10")
+    columns = {
+        "temp_f": (t2 - 273.15) * 9/5 + 32,
+        "dewpoint_f": td2 * 9/5 + 32,
+        "wspd_mph": wspd_wdir[0],
+        "wdir": wspd_wdir[1],
+        "cardinal": deg_to_cardinals(wspd_wdir[1]),
+        "mslp_mb": mslp / 100,
+        "u10": u10,
+        "v10": v10,
+    }
+    return {name: {column: values[:, i] for column, values in columns.items()} for i, name in enumerate(names)}
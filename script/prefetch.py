@@ -0,0 +1,85 @@
+# This module reads the raw wrfout variables for upcoming hours in a background process while the current hour renders.
+# the reader owns its own Dataset handle and hands each hour over as the same {name: DataArray} dict wrf-python's extract_vars
+# builds, which getvar takes through its cache argument, so the diagnostics for that hour never touch the disk themselves.
+# (it's a process rather than a thread: netCDF4 holds the GIL while it reads and netcdf-c isn't thread safe.)
+
+import queue
+import multiprocessing
+import numpy as np
+from netCDF4 import Dataset
+
+# the 3d state every diagnostic we plot is built from, plus the 2d fields we plot or derive from directly.
+# anything that isn't in the file is skipped, and anything a diagnostic needs that isn't here just gets read the usual way
+RAW_VARIABLES = (
+    "P", "PB", "T", "QVAPOR", "PH", "PHB", "U", "V", "W",
+    "HGT", "PSFC", "T2", "Q2", "U10", "V10", "AFWA_MSLP", "WSPD10MAX", "REFD_COM", "UP_HELI_MAX",
+    "AFWA_TOTPRECIP", "SNOWNC", "AFWA_SNOW", "AFWA_RAIN", "AFWA_FZRA", "AFWA_ICE", "AFWA_PWAT",
+)
+
+def tune_chunk_cache(wrf_file, slack=2, preemption=1.0):
+    # netcdf's default per-variable chunk cache is only a few MB, smaller than one compressed 3d chunk of a wrfout.
+    # a chunk that doesn't fit gets decompressed again for every read that touches it (every hour, when chunks span several),
+    # so give each chunked variable room for a couple of its chunks, and evict chunks we've finished reading first
+    for var in wrf_file.variables.values():
+        chunking = var.chunking()
+        if not isinstance(chunking, (list, tuple)):
+            continue
+        chunk_bytes = int(np.prod(chunking)) * var.dtype.itemsize
+        size, nelems, _ = var.get_var_chunk_cache()
+        if chunk_bytes * slack > size:
+            var.set_var_chunk_cache(size=chunk_bytes * slack, nelems=nelems, preemption=preemption)
+
+def read_ahead(wrf_path, timesteps, variables, out):
+    # runs in the reader process: one (timestep, {name: DataArray}) per hour, blocking whenever the queue is full
+    try:
+        from wrf import extract_vars
+        wrf_file = Dataset(wrf_path)
+        tune_chunk_cache(wrf_file)
+        names = [name for name in variables if name in wrf_file.variables]
+        for t in timesteps:
+            out.put((t, extract_vars(wrf_file, t, names, meta=True)))
+    except Exception as e:
+        out.put((None, f"{type(e).__name__}: {e}"))
+
+class Prefetcher:
+    # depth is how many hours the reader is allowed to get ahead of the renderer
+    def __init__(self, wrf_path, timesteps, variables=RAW_VARIABLES, depth=2):
+        # default start method, same as the render and cape pools. ugawrf.py's __main__ guard keeps spawn from re-running it
+        context = multiprocessing.get_context()
+        self.queue = context.Queue(maxsize=depth)
+        self.pending = list(timesteps)
+        self.ready = {}
+        self.failed = False
+        self.process = context.Process(target=read_ahead, args=(wrf_path, self.pending.copy(), tuple(variables), self.queue), daemon=True)
+        self.process.start()
+
+    def raw(self, timestep):
+        # blocks until the reader gets to timestep. hours it isn't going to deliver (already handed out, never asked for, reader died)
+        # come back as None, and the caller reads them itself
+        if self.failed or (timestep not in self.ready and timestep not in self.pending):
+            return None
+        while timestep not in self.ready:
+            try:
+                t, fields = self.queue.get(timeout=5)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    print("warning: prefetch reader exited early, reading the rest of the run directly")
+                    self.failed = True
+                    return None
+                continue
+            if t is None:
+                print(f"warning: prefetch reader failed ({fields}), reading the rest of the run directly")
+                self.failed = True
+                return None
+            self.pending.remove(t)
+            self.ready[t] = fields
+        # anything older than this hour was skipped over and isn't coming back around
+        for t in [t for t in self.ready if t < timestep]:
+            del self.ready[t]
+        return self.ready.pop(timestep)
+
+    def close(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.queue.close()
@@ -0,0 +1,65 @@
+# This module draws gridded fields that are only ever a colormap over the grid (cloud cover, ptype, stargazing) as one image.
+# every pixel of a regular lon/lat raster over the map's view is tied to its nearest grid point once per domain and view
+# (the index map), so a frame is just the field run through its norm/colormap at the grid points (the lookup table) and
+# gathered out to the pixels with numpy, then dropped in with imshow, instead of cartopy building a quad per grid cell.
+
+import numpy as np
+import matplotlib
+import cartopy.crs as ccrs
+from scipy.spatial import cKDTree
+from matplotlib import colors
+from matplotlib.cm import ScalarMappable
+
+# raster pixels per screen pixel of the axes: the maps are saved at 125 dpi off of 100 dpi figures
+OVERSAMPLE = 1.25
+
+_index_maps = {}
+
+def get_cmap(cmap):
+    return cmap if isinstance(cmap, colors.Colormap) else matplotlib.colormaps[cmap]
+
+def unit_vectors(lons, lats):
+    lon, lat = np.radians(lons), np.radians(lats)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1).reshape(-1, 3)
+
+def index_map(lons, lats, extent, shape):
+    # flat index of the nearest grid point for each raster pixel (rows south to north), -1 past the edge of the grid
+    lons, lats = np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64)
+    key = (lons.shape, float(lons[0, 0]), float(lats[0, 0]), float(lons[-1, -1]), float(lats[-1, -1]), tuple(extent), shape)
+    if key not in _index_maps:
+        west, east, south, north = extent
+        rows, cols = shape
+        # pixel centers
+        pixel_lons = west + (np.arange(cols) + 0.5) * (east - west) / cols
+        pixel_lats = south + (np.arange(rows) + 0.5) * (north - south) / rows
+        pixel_lons, pixel_lats = np.meshgrid(pixel_lons, pixel_lats)
+        distance, index = cKDTree(unit_vectors(lons, lats)).query(unit_vectors(pixel_lons, pixel_lats))
+        # pcolormesh's cells reach half a grid spacing past the outermost points, so anything further than a spacing out is off the grid
+        points = unit_vectors(lons, lats).reshape(lons.shape + (3,))
+        spacing = max(np.max(np.linalg.norm(np.diff(points, axis=axis), axis=-1)) for axis in (0, 1))
+        index[distance > spacing] = -1
+        _index_maps[key] = index.reshape(shape)
+    return _index_maps[key]
+
+def contour_colors(cmap, levels):
+    # the flat colors contourf(levels=levels, extend='both') fills each band with, as a colormap/norm pair
+    cmap = get_cmap(cmap)
+    levels = np.asarray(levels, dtype=np.float64)
+    norm = colors.Normalize(levels[0], levels[-1])
+    banded = colors.ListedColormap(cmap(norm(0.5 * (levels[:-1] + levels[1:]))))
+    banded.set_extremes(under=cmap.get_under(), over=cmap.get_over())
+    # so colorbars get the extend triangles contourf's would have
+    banded.colorbar_extend = "both"
+    return banded, colors.BoundaryNorm(levels, banded.N)
+
+def draw_raster(ax, field, lons, lats, cmap, norm, zorder=1):
+    # stands in for ax.pcolormesh(lons, lats, field, cmap=cmap, norm=norm, transform=PlateCarree()), returns something to hang a colorbar on
+    cmap = get_cmap(cmap)
+    west, east, south, north = ax.get_extent(ccrs.PlateCarree())
+    shape = (max(1, int(ax.bbox.height * OVERSAMPLE)), max(1, int(ax.bbox.width * OVERSAMPLE)))
+    index = index_map(lons, lats, (west, east, south, north), shape)
+    lut = cmap(norm(np.ma.masked_invalid(np.ma.asarray(field, dtype=np.float64)).ravel()), bytes=True)
+    image = lut[np.maximum(index, 0)]
+    image[index < 0] = 0
+    ax.imshow(image, extent=(west, east, south, north), origin="lower", transform=ccrs.PlateCarree(), interpolation="nearest", zorder=zorder)
+    return ScalarMappable(norm=norm, cmap=cmap)
@@ -0,0 +1,126 @@
+# This module holds the parts of our maps that never change within a run - the figure, the GeoAxes, counties/states/borders/coastlines,
+# gridlines and colormaps - so they're built once per process. each frame only adds its own data layers (contours, barbs, labels, titles)
+# and those get stripped back off when the frame is done.
+
+import functools
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import cartopy.crs as ccrs
+import cartopy.feature as cfeature
+from metpy.plots import ctables, USCOUNTIES
+import basemapcache
+
+# features are added in the same order the plots used to add them, with cartopy's default zorder (1.5, above filled contours).
+# they're drawn from basemapcache's pre-rendered layers rather than re-rasterized every frame.
+LAYOUTS = {
+    "map": {
+        "nrows": 1, "ncols": 1,
+        "features": [("counties", {"alpha": 0.05}), ("coastlines", {}), ("borders", {"linewidth": 0.5}), ("states_50m", {})],
+        "gridlines": True,
+    },
+    "24hr_change": {
+        "nrows": 1, "ncols": 1,
+        "features": [("coastlines", {}), ("borders", {"linewidth": 0.5}), ("states_50m", {}), ("counties", {"alpha": 0.2})],
+        "gridlines": False,
+    },
+    "4panel_cloudcover": {
+        "nrows": 2, "ncols": 2,
+        "features": [("coastlines", {}), ("borders", {"linewidth": 0.5}), ("states", {"linewidth": 0.5})],
+        "gridlines": False,
+    },
+    "4panel_ptype": {
+        "nrows": 2, "ncols": 2,
+        "features": [("coastlines", {}), ("borders", {"linewidth": 0.5}), ("states", {"linewidth": 0.5}), ("counties", {"alpha": 0.05})],
+        "gridlines": False,
+    },
+}
+
+def add_feature(ax, name, kwargs):
+    if name == "coastlines":
+        ax.coastlines(**kwargs)
+    elif name == "borders":
+        ax.add_feature(cfeature.BORDERS, **kwargs)
+    elif name == "states":
+        ax.add_feature(cfeature.STATES, **kwargs)
+    elif name == "states_50m":
+        ax.add_feature(cfeature.STATES.with_scale('50m'), **kwargs)
+    elif name == "counties":
+        ax.add_feature(USCOUNTIES.with_scale('20m'), **kwargs)
+    else:
+        raise ValueError(f"unknown basemap feature {name}")
+
+_layer_cache = basemapcache.LayerCache(add_feature)
+
+@functools.lru_cache(maxsize=None)
+def get_colortable(name):
+    return ctables.registry.get_colortable(name)
+
+class RenderContext:
+    def __init__(self, layout, lons, lats, extent=None):
+        spec = LAYOUTS[layout]
+        self.layout = layout
+        self.fig, self.axes = plt.subplots(nrows=spec["nrows"], ncols=spec["ncols"], figsize=(12, 10), subplot_kw=dict(projection=ccrs.PlateCarree()))
+        self.ax_list = list(np.atleast_1d(self.axes).flat)
+        # the plots used to autoscale to the data, which is the same as pinning the extent to the grid
+        self.extent = extent if extent is not None else [float(np.min(lons)), float(np.max(lons)), float(np.min(lats)), float(np.max(lats))]
+        for ax in self.ax_list:
+            ax.set_extent(self.extent, crs=ccrs.PlateCarree())
+            underlay, overlay = basemapcache.split_features(spec["features"])
+            if underlay:
+                ax.add_artist(basemapcache.CachedLayer(ax, f"{layout}_underlay", underlay, _layer_cache, basemapcache.DATA_ZORDER - 0.5))
+            if overlay:
+                ax.add_artist(basemapcache.CachedLayer(ax, f"{layout}_overlay", overlay, _layer_cache, 1.5))
+            if spec["gridlines"]:
+                gl = ax.gridlines(crs=ccrs.PlateCarree(), draw_labels=True, linewidth=0.5, color='gray', alpha=0.5, linestyle='--')
+                gl.top_labels = False; gl.right_labels = False
+                # gridlines used to go on after the data's contour lines, keep them drawing on top of those
+                gl.set_zorder(2.5)
+        if spec["nrows"] * spec["ncols"] > 1:
+            # make the suptitle part of the template so every frame just updates its text
+            self.fig.suptitle("")
+        self.subplotspecs = [ax.get_subplotspec() for ax in self.ax_list]
+        self.anchors = [ax.get_anchor() for ax in self.ax_list]
+        self.positions = [ax.get_position(original=True) for ax in self.ax_list]
+        self.base_children = [set(ax.get_children()) for ax in self.ax_list]
+        self.base_axes = set(self.fig.axes)
+        self.base_texts = set(self.fig.texts)
+        self.active = False
+
+    def begin(self):
+        # clear out anything a failed frame may have left behind
+        if self.active:
+            self.finish()
+        self.active = True
+        return self.fig, self.axes
+
+    def finish(self):
+        for cax in [a for a in self.fig.axes if a not in self.base_axes]:
+            colorbar = getattr(cax, "_colorbar", None)
+            if colorbar is not None:
+                colorbar.remove()
+            else:
+                cax.remove()
+        for ax, children in zip(self.ax_list, self.base_children):
+            for child in [c for c in ax.get_children() if c not in children]:
+                child.remove()
+        for text in [t for t in self.fig.texts if t not in self.base_texts]:
+            text.remove()
+        # colorbars and tight_layout move the axes around, put them back where the template had them
+        for ax, subplotspec, anchor, position in zip(self.ax_list, self.subplotspecs, self.anchors, self.positions):
+            ax.set_subplotspec(subplotspec)
+            ax.set_anchor(anchor)
+            ax.set_position(position)
+        self.active = False
+
+_contexts = {}
+
+def get_render_context(layout, lons, lats, extent=None):
+    # one template per layout/domain per process
+    lons = np.asarray(lons)
+    lats = np.asarray(lats)
+    key = (layout, tuple(extent) if extent is not None else None, lons.shape, float(lons.min()), float(lons.max()), float(lats.min()), float(lats.max()))
+    if key not in _contexts:
+        _contexts[key] = RenderContext(layout, lons, lats, extent)
+    return _contexts[key]
@@ -0,0 +1,110 @@
+# This module spreads our (product, timestep) frames across a process pool.
+# each worker opens its own wrfout handle and field cache, renders whatever frames it's handed, and reports per-frame timing/errors back.
+
+import os
+import time
+import math
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from netCDF4 import Dataset
+from fieldcache import FieldCache
+from derivedstore import DerivedStore
+import basemapcache
+import imagewriter
+from manifest import frame_files
+from stations import get_station_index
+from soundings import Soundings
+
+# per-process state, filled in by init_worker
+_worker = {}
+
+def init_worker(wrf_path, cache_mb, run_info):
+    _worker["wrf_file"] = Dataset(wrf_path)
+    _worker["cache"] = FieldCache(cache_mb, run_info["levels"], run_info["level_variables"], run_info["cape_workers"])
+    _worker["run_info"] = run_info
+    if run_info["derived_store"]:
+        _worker["cache"].store = DerivedStore(run_info["derived_store"], wrf_path, _worker["wrf_file"])
+    basemapcache.set_cache_dir(run_info["basemap_cache"])
+    imagewriter.configure(run_info["image_format"], run_info["encode_threads"])
+    get_station_index(_worker["wrf_file"], _worker["cache"]).locate(list(run_info["airports"].values()))
+    _worker["soundings"] = Soundings(_worker["wrf_file"], run_info["skewt_points"])
+    if run_info["kuchera_snowfall"] is not None:
+        import weathermaps
+        weathermaps.seed_kuchera_snowfall(_worker["cache"], run_info["kuchera_snowfall"])
+
+def render_frames(frames):
+    # frames for one task all share a timestep, so the worker's cache stays warm between them
+    results = []
+    for frame in frames:
+        frame_time = time.perf_counter()
+        try:
+            written = render_frame(frame)
+            error = None
+        except Exception as e:
+            written = False
+            error = f"{type(e).__name__}: {e}"
+        results.append((frame, time.perf_counter() - frame_time, error, written))
+    # the task's images have to be on disk before its frames are reported done, or the manifest would record ones that never got written
+    failed = imagewriter.flush()
+    if failed:
+        info = _worker["run_info"]
+        run_path = os.path.join(info["base_output"], info["file_path"][0], info["file_path"][1])
+        for i, (frame, elapsed, error, written) in enumerate(results):
+            errors = [failed[path] for path in frame_files(frame, run_path, info["forecast_times"], info["init_dt"], info["map_output"]) if path in failed]
+            if errors:
+                results[i] = (frame, elapsed, error or f"image write failed: {errors[0]}", False)
+    return results
+
+def render_frame(frame):
+    # returns whether anything got written (maps skip some frames on partial runs)
+    kind, name, t, extra = frame
+    wrf_file = _worker["wrf_file"]
+    cache = _worker["cache"]
+    info = _worker["run_info"]
+    run_path = os.path.join(info["base_output"], info["file_path"][0], info["file_path"][1])
+    if kind == "map":
+        import weathermaps
+        variable, level = extra
+        return weathermaps.plot_variable(name, variable, t, os.path.join(run_path, name), info["forecast_times"], info["airports"], None, None, info["file_path"], info["init_dt"], info["init_str"], wrf_file, level, info["partial"], cache, info["export"], info["map_output"], info["contour_tolerance"])
+    elif kind == "4panel_cloudcover":
+        import special
+        special.generate_cloud_cover(t, os.path.join(run_path, name), info["forecast_times"], info["file_path"][0], info["init_dt"], info["init_str"], wrf_file, cache)
+    elif kind == "4panel_ptype":
+        import special
+        special.plot_4panel_ptype(t, os.path.join(run_path, name), info["forecast_times"], info["file_path"][0], info["init_dt"], info["init_str"], wrf_file, cache)
+    elif kind == "24hr_change":
+        import special
+        special.hr24_change(os.path.join(run_path, name), info["airports"], t, info["forecast_times"], info["file_path"][0], info["init_dt"], info["init_str"], wrf_file, cache=cache)
+    elif kind == "skewt":
+        import skewt
+        skewt.plot_skewt(wrf_file, extra, t, name, os.path.join(run_path, "skewt", name), info["forecast_times"], info["init_dt"], info["init_str"], info["file_path"], _worker["soundings"].get(name, t), _worker["soundings"].indices(name, t))
+    else:
+        raise ValueError(f"unknown frame kind {kind}")
+    return True
+
+def split_tasks(frames_by_hour, workers):
+    # one task per hour when there are enough hours to go around, otherwise split each hour up so no worker sits idle
+    chunks_per_hour = max(1, math.ceil(workers / max(len(frames_by_hour), 1)))
+    tasks = []
+    for frames in frames_by_hour:
+        size = max(1, math.ceil(len(frames) / chunks_per_hour))
+        tasks.extend(frames[i:i + size] for i in range(0, len(frames), size))
+    return tasks
+
+def run_pool(frames_by_hour, workers, wrf_path, cache_mb, run_info):
+    # returns {frame label: [times]}, a list of (frame, error) so the caller can print a summary, and the frames that made it to disk
+    timings = {}
+    errors = []
+    written = []
+    tasks = split_tasks(frames_by_hour, workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(wrf_path, cache_mb, run_info)) as pool:
+        futures = [pool.submit(render_frames, task) for task in tasks]
+        for future in as_completed(futures):
+            for frame, elapsed, error, frame_written in future.result():
+                kind, name, t, _ = frame
+                timings.setdefault(name if kind != "skewt" else f"skewt/{name}", []).append(elapsed)
+                if error:
+                    errors.append((frame, error))
+                    print(f"error processing {name}: {error}! timestep: {t}")
+                elif frame_written:
+                    written.append(frame)
+    return timings, errors, written
@@ -0,0 +1,120 @@
+# This module works out the gridded severe weather parameters (SRH, bulk shear, lifted index, K index/total totals, STP/SCP).
+# everything is done for the whole domain at once with array math down the model columns,
+# instead of pulling soundings and running metpy point by point.
+
+import numpy as np
+from wrf import to_np
+import thermo
+from levelstack import level_weights, apply_weights
+
+MS_TO_KT = 1.94384
+
+def layer_segments(field, hagl, bottom, top):
+    # the piece of every model layer (k, k+1) that falls inside [bottom, top] m AGL, and the field at both of its ends.
+    # layers completely outside come back with zero thickness, so they drop out of sums on their own
+    h0, h1 = hagl[:-1], hagl[1:]
+    a = np.clip(h0, bottom, top)
+    b = np.clip(h1, bottom, top)
+    f0, f1 = field[:-1], field[1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (f1 - f0) / (h1 - h0)
+    return a, b, f0 + (a - h0) * slope, f0 + (b - h0) * slope
+
+def layer_mean(field, hagl, bottom, top):
+    # trapezoid mean over bottom-top m AGL (starting at the lowest model level if that's above bottom)
+    a, b, fa, fb = layer_segments(field, hagl, bottom, top)
+    return np.sum(0.5 * (fa + fb) * (b - a), axis=0) / np.sum(b - a, axis=0)
+
+def at_height(field, hagl, height):
+    # field at height m AGL, linear in height. columns whose lowest level is above it get the lowest level
+    k = np.clip(np.count_nonzero(hagl < height, axis=0) - 1, 0, hagl.shape[0] - 2)
+    h0 = np.take_along_axis(hagl, k[None], axis=0)[0]
+    h1 = np.take_along_axis(hagl, k[None] + 1, axis=0)[0]
+    f0 = np.take_along_axis(field, k[None], axis=0)[0]
+    f1 = np.take_along_axis(field, k[None] + 1, axis=0)[0]
+    weight = np.clip((height - h0) / (h1 - h0), 0, 1)
+    return f0 + weight * (f1 - f0)
+
+def bunkers_right_mover(u, v, hagl):
+    # Bunkers et al. (2000): 0-6 km mean wind, deviated 7.5 m/s to the right of the 0-0.5 km to 5.5-6 km shear.
+    # the means are height-weighted rather than metpy's pressure-weighted ones
+    mean_u, mean_v = layer_mean(u, hagl, 0, 6000), layer_mean(v, hagl, 0, 6000)
+    shear_u = layer_mean(u, hagl, 5500, 6000) - layer_mean(u, hagl, 0, 500)
+    shear_v = layer_mean(v, hagl, 5500, 6000) - layer_mean(v, hagl, 0, 500)
+    shear = np.hypot(shear_u, shear_v)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(shear > 0, 7.5 / shear, 0)
+    return mean_u + scale * shear_v, mean_v - scale * shear_u
+
+def storm_relative_helicity(u, v, hagl, depth, storm_u, storm_v):
+    # sum of (u_top - cu)(v_bottom - cv) - (u_bottom - cu)(v_top - cv) over the layers between the lowest level and depth m AGL
+    _, _, u_a, u_b = layer_segments(u, hagl, 0, depth)
+    _, _, v_a, v_b = layer_segments(v, hagl, 0, depth)
+    return np.sum((u_b - storm_u) * (v_a - storm_v) - (u_a - storm_u) * (v_b - storm_v), axis=0)
+
+def bulk_shear(u, v, hagl, depth):
+    # magnitude of the wind difference between the lowest model level and depth m AGL, m/s
+    return np.hypot(at_height(u, hagl, depth) - u[0], at_height(v, hagl, depth) - v[0])
+
+def kinematic_parameters(wrf_file, timestep, cache):
+    # 0-1/0-3 km SRH (right mover), 0-6 km shear (kt) and the Bunkers storm motion, worked out once per timestep
+    def compute():
+        u = to_np(cache.get(wrf_file, "ua", timestep)).astype(np.float32)
+        v = to_np(cache.get(wrf_file, "va", timestep)).astype(np.float32)
+        hagl = to_np(cache.get(wrf_file, "height_agl", timestep)).astype(np.float32)
+        storm_u, storm_v = bunkers_right_mover(u, v, hagl)
+        return {
+            "srh_1km": storm_relative_helicity(u, v, hagl, 1000, storm_u, storm_v),
+            "srh_3km": storm_relative_helicity(u, v, hagl, 3000, storm_u, storm_v),
+            "shear_6km": bulk_shear(u, v, hagl, 6000) * MS_TO_KT,
+            "storm_u": storm_u,
+            "storm_v": storm_v,
+        }
+    return cache.derived("severe_kinematics", timestep, compute)
+
+def lifted_index(pressure, tc, td):
+    # 500 mb environment minus the lowest model level's parcel lifted to 500 mb (hPa/degC in, all on the same grid)
+    p = pressure[0].astype(np.float64) * 100
+    t = tc[0].astype(np.float64) + thermo.ZERO_DEGC
+    d = td[0].astype(np.float64) + thermo.ZERO_DEGC
+    p_lcl, t_lcl = thermo.lcl(p, t, d)
+    target = np.full(p.size, 50000.0)
+    moist = thermo.moist_lapse(target[:, None], t_lcl.ravel(), p_lcl.ravel())[:, 0].reshape(p.shape)
+    with np.errstate(invalid="ignore"):
+        parcel = np.where(p_lcl > 50000.0, moist, thermo.dry_lapse(50000.0, t, p))
+    lower, weight, valid = level_weights(pressure, (500,))
+    return apply_weights(tc, lower, weight, valid)[0] - (parcel - thermo.ZERO_DEGC)
+
+def stability_indices(wrf_file, timestep, cache):
+    # lifted index, K index and total totals for every column, worked out once per timestep
+    def compute():
+        pressure = to_np(cache.get(wrf_file, "pressure", timestep))
+        tc = to_np(cache.get(wrf_file, "tc", timestep))
+        td = to_np(cache.get(wrf_file, "td", timestep))
+        lower, weight, valid = level_weights(pressure, (850, 700, 500))
+        t850, t700, t500 = apply_weights(tc, lower, weight, valid)
+        td850, td700, _ = apply_weights(td, lower, weight, valid)
+        return {
+            "lifted_index": lifted_index(pressure, tc, td).astype(np.float32),
+            "k_index": (t850 - t500) + td850 - (t700 - td700),
+            "total_totals": (t850 - t500) + (td850 - t500),
+        }
+    return cache.derived("severe_stability", timestep, compute)
+
+def composite_parameters(wrf_file, timestep, cache):
+    # fixed-layer significant tornado and supercell composites. wrf's cape_2d (most unstable parcel) stands in for
+    # the SBCAPE/MUCAPE and LCL height terms, and 0-3 km SRH/0-6 km shear for SCP's effective layer ones
+    def compute():
+        cape_2d = to_np(cache.get(wrf_file, "cape_2d", timestep))
+        cape, lcl_height = np.nan_to_num(cape_2d[0]), cape_2d[2]
+        kinematics = kinematic_parameters(wrf_file, timestep, cache)
+        shear = kinematics["shear_6km"] / MS_TO_KT
+        with np.errstate(invalid="ignore"):
+            lcl_term = np.clip((2000 - np.nan_to_num(lcl_height, nan=2000)) / 1000, 0, 1)
+            stp_shear = np.where(shear < 12.5, 0, np.minimum(shear, 30) / 20)
+            scp_shear = np.where(shear < 10, 0, np.minimum(shear, 20) / 20)
+        return {
+            "stp": np.maximum((cape / 1500) * lcl_term * (kinematics["srh_1km"] / 150) * stp_shear, 0),
+            "scp": np.maximum((cape / 1000) * (kinematics["srh_3km"] / 50) * scp_shear, 0),
+        }
+    return cache.derived("severe_composites", timestep, compute)
@@ -0,0 +1,97 @@
+# This module is a drop-in for wrf-python's smooth2d that does any number of passes in one go.
+# smooth2d (DFILTER2D in wrf_user.f90) runs a 5-point smoother over the grid once per pass with the border held fixed: a j pass
+# then an i pass, both off of the previous pass's values, which adds up to (n + s + e + w + cenweight * center) / (4 + cenweight).
+# that's a linear operator with fixed boundary values, and the plus-shaped kernel is diagonalized by the 2d sine transform (DST-I),
+# so n passes collapse to one forward transform, a per-wavenumber factor, and one inverse transform, however big n is.
+# run this file directly to check it against wrf's own smooth2d.
+# the transforms cost about as much as a couple dozen passes, so short smooths (and fields with missing values,
+# which wrf has its own rules for) still go through wrf's own smooth2d.
+
+import numpy as np
+from wrf import smooth2d as wrf_smooth2d
+
+try:
+    from scipy.fft import dst as scipy_dst
+except ImportError:
+    scipy_dst = None
+
+# below this many passes the pass-by-pass loop is cheaper than the transforms (measured on a 400x500 grid)
+TRANSFORM_PASSES = 16
+
+def dst(x, axis):
+    # orthonormal DST-I along one axis (its own inverse), numpy's FFT of the odd extension of x if scipy isn't around
+    if scipy_dst is not None:
+        return scipy_dst(x, type=1, axis=axis, norm="ortho")
+    x = np.moveaxis(x, axis, -1)
+    n = x.shape[-1]
+    zero = np.zeros(x.shape[:-1] + (1,))
+    extended = np.concatenate([zero, x, zero, -x[..., ::-1]], axis=-1)
+    y = -np.fft.rfft(extended, axis=-1).imag[..., 1:n + 1] * np.sqrt(0.5 / (n + 1))
+    return np.moveaxis(y, -1, axis)
+
+def dst2(x):
+    return dst(dst(x, 0), 1)
+
+def ring_dst2(x):
+    # dst2 of an array that's zero everywhere but its outermost rows/columns, from 1d transforms of just those edges
+    m, n = x.shape
+    if min(m, n) < 3:
+        return dst2(x)
+    rows = x[[0, -1], :]
+    cols = x[:, [0, -1]].copy()
+    cols[[0, -1], :] = 0
+    row_basis = dst(np.eye(m)[:, [0, -1]], 0)
+    col_basis = dst(np.eye(n)[[0, -1], :], 1)
+    return row_basis @ dst(rows, 1) + dst(cols, 0) @ col_basis
+
+def _neighbor_sum(x):
+    # sum of the 4 edge neighbors over the interior of x
+    return x[:-2, 1:-1] + x[2:, 1:-1] + x[1:-1, :-2] + x[1:-1, 2:]
+
+def smooth2d(field, passes, cenweight=2.0):
+    # same arguments as wrf.smooth2d, returns a plain array
+    values = np.ma.filled(np.ma.asarray(field, dtype=np.float64), np.nan)
+    if passes <= 0 or min(values.shape[-2:]) < 3:
+        return values
+    if passes < TRANSFORM_PASSES or not np.all(np.isfinite(values)):
+        return np.asarray(wrf_smooth2d(field, passes, cenweight, meta=False))
+    return transform_smooth2d(values, passes, cenweight)
+
+def transform_smooth2d(values, passes, cenweight=2.0):
+    # n passes of the 5-point smoother on a finite array in one go
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim > 2:
+        return np.stack([transform_smooth2d(v, passes, cenweight) for v in values.reshape((-1,) + values.shape[-2:])]).reshape(values.shape)
+    ny, nx = values.shape
+    weight = 4.0 + cenweight
+    # what the fixed border adds to the interior on every pass
+    border = values.copy()
+    border[1:-1, 1:-1] = 0
+    forcing = _neighbor_sum(border) / weight
+    # eigenvalues of one pass on the interior: each axis's pair of neighbors has 2cos(k pi / (n + 1)) along it
+    lam_y = 2 * np.cos(np.arange(1, ny - 1) * np.pi / (ny - 1))
+    lam_x = 2 * np.cos(np.arange(1, nx - 1) * np.pi / (nx - 1))
+    mu = (cenweight + lam_y[:, None] + lam_x[None, :]) / weight
+    mu_n = mu ** passes
+    # u_n = K^n u_0 + (1 + K + ... + K^(n-1)) forcing, one wavenumber at a time
+    with np.errstate(divide="ignore", invalid="ignore"):
+        series = np.where(np.isclose(mu, 1), passes, (1 - mu_n) / (1 - mu))
+    interior = dst2(mu_n * dst2(values[1:-1, 1:-1]) + series * ring_dst2(forcing))
+    out = values.copy()
+    out[1:-1, 1:-1] = interior
+    return out
+
+if __name__ == "__main__":
+    import time
+    rng = np.random.default_rng(0)
+    smooth = np.cumsum(np.cumsum(rng.normal(size=(400, 500)), axis=0), axis=1) + 5500
+    rough = rng.normal(size=(400, 500)) * 10 + 5500
+    for name, field in (("smooth", smooth), ("rough", rough)):
+        for passes, cenweight in ((16, 2.0), (40, 6)):
+            start = time.perf_counter()
+            reference = np.asarray(wrf_smooth2d(field, passes, cenweight, meta=False))
+            wrf_time = time.perf_counter() - start
+            start = time.perf_counter()
+            fast = transform_smooth2d(field, passes, cenweight)
+            fast_time = time.perf_counter() - start
+            print(f"{name} field, {passes} passes, cenweight {cenweight}: max difference from wrf {np.max(np.abs(fast - reference)):.1e} ({wrf_time:.3f}s in wrf, {fast_time:.3f}s in one go)")
@@ -0,0 +1,113 @@
+# This module pulls the skewt soundings straight out of the raw wrfout variables, only at the columns we actually plot.
+# every skewt site is gathered together once per timestep into a compact (field, station, time, level) array,
+# instead of computing full 3d pressure/tc/td/ua/va/z over the whole domain for every airport and every hour.
+# the skewt indices (CAPE/CIN, LCL/LFC, K index, total totals) are worked out for every station in the same pass with thermo.
+
+import numpy as np
+import thermo
+
+# same constants wrf-python uses for these diagnostics
+RD = 287.0
+CP = 1004.5
+P1000MB = 100000.0
+CELKEL = 273.15
+G = 9.81
+T_BASE = 300.0
+
+SOUNDING_FIELDS = ("pressure", "tc", "td", "ua", "va", "z")
+INDEX_FIELDS = ("sbcape", "sbcin", "mucape", "mucin", "mlcape", "mlcin", "lcl_pressure", "lcl_temperature",
+                "lfc_pressure", "lfc_temperature", "k_index", "total_totals")
+
+def column_diagnostics(wrf_file, timestep, j, i):
+    # j, i are arrays of south_north/west_east indices. returns {field: (bottom_top, station)} in the same units getvar gives
+    ncvars = wrf_file.variables
+    def column(name, stagger=None):
+        field = ncvars[name][timestep]
+        if stagger == "west_east":
+            return 0.5 * (field[:, j, i] + field[:, j, i + 1])
+        if stagger == "south_north":
+            return 0.5 * (field[:, j, i] + field[:, j + 1, i])
+        return field[:, j, i]
+    full_p = column("P") + column("PB")
+    theta = column("T") + T_BASE
+    tk = ((full_p.astype(np.float64) / P1000MB) ** (RD / CP) * theta).astype(np.float32)
+    qv = np.maximum(column("QVAPOR").astype(np.float64), 0)
+    # vapor pressure in hPa, floored the same way wrf does to avoid log(0)
+    e = np.maximum(qv * (0.01 * full_p) / (0.622 + qv), 0.001)
+    td = (243.5 * np.log(e) - 440.8) / (19.48 - np.log(e))
+    geopt = column("PH") + column("PHB")
+    return {
+        "pressure": full_p * 0.01,
+        "tc": tk - CELKEL,
+        "td": td.astype(np.float32),
+        "ua": column("U", "west_east"),
+        "va": column("V", "south_north"),
+        "z": 0.5 * (geopt[:-1] + geopt[1:]) / G,
+    }
+
+class Soundings:
+    # stations is {name: x_y}, with x_y the same (first, second) grid index pair plot_skewt has always used.
+    # timesteps are filled in on first use, for every station at once.
+    def __init__(self, wrf_file, stations):
+        self.wrf_file = wrf_file
+        self.names = list(stations)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        # skewts have always indexed [:, x_y[0], x_y[1]], i.e. x_y[0] picks the south_north row
+        self.j = np.array([int(stations[name][0]) for name in self.names])
+        self.i = np.array([int(stations[name][1]) for name in self.names])
+        times, levels, ny, nx = wrf_file.variables["P"].shape
+        # a station off the grid only fails its own skewts, not everyone else's
+        self.valid = (self.j >= 0) & (self.j < ny) & (self.i >= 0) & (self.i < nx)
+        self.data = np.full((len(SOUNDING_FIELDS), len(self.names), times, levels), np.nan, dtype=np.float32)
+        self.index_data = np.full((len(INDEX_FIELDS), len(self.names), times), np.nan)
+        self.parcel = np.full((len(self.names), times, levels), np.nan)
+        self.filled = np.zeros(times, dtype=bool)
+
+    def fill(self, timestep):
+        columns = column_diagnostics(self.wrf_file, timestep, self.j[self.valid], self.i[self.valid])
+        for f, field in enumerate(SOUNDING_FIELDS):
+            self.data[f, self.valid, timestep] = np.asarray(columns[field]).T
+        computed = thermo.parcel_indices(*(self.data[SOUNDING_FIELDS.index(field), self.valid, timestep] for field in ("pressure", "tc", "td")))
+        for f, field in enumerate(INDEX_FIELDS):
+            self.index_data[f, self.valid, timestep] = computed[field]
+        self.parcel[self.valid, timestep] = computed["parcel"]
+        self.filled[timestep] = True
+
+    def _station(self, station, timestep):
+        if not self.filled[timestep]:
+            self.fill(timestep)
+        s = self.index[station]
+        if not self.valid[s]:
+            raise IndexError(f"{station} at {self.j[s]}, {self.i[s]} is outside the grid")
+        return s
+
+    def get(self, station, timestep):
+        s = self._station(station, timestep)
+        return {field: self.data[f, s, timestep] for f, field in enumerate(SOUNDING_FIELDS)}
+
+    def indices(self, station, timestep):
+        # {name: value} for the skewt's parameter box and LCL/LFC markers, plus "parcel" (the surface parcel profile, degC)
+        s = self._station(station, timestep)
+        values = {field: float(self.index_data[f, s, timestep]) for f, field in enumerate(INDEX_FIELDS)}
+        values["parcel"] = self.parcel[s, timestep]
+        return values
+
+    def table(self, timesteps=None):
+        # every station's indices without drawing anything: {name: {field: array over timesteps}}, nan for stations off the grid
+        timesteps = range(len(self.filled)) if timesteps is None else timesteps
+        for t in timesteps:
+            if not self.filled[t]:
+                self.fill(t)
+        timesteps = list(timesteps)
+        return {name: {field: self.index_data[f, s, timesteps] for f, field in enumerate(INDEX_FIELDS)}
+                for s, name in enumerate(self.names)}
+
+def single_sounding(wrf_file, x_y, timestep):
+    return Soundings(wrf_file, {"point": x_y}).get("point", timestep)
+
+def sounding_indices(sounding):
+    # the same {name: value} Soundings.indices gives, for one column that didn't come through a Soundings
+    computed = thermo.parcel_indices(sounding["pressure"], sounding["tc"], sounding["td"])
+    values = {field: float(computed[field]) for field in INDEX_FIELDS}
+    values["parcel"] = computed["parcel"]
+    return values
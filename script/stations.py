@@ -0,0 +1,75 @@
+# This module turns station lat/lons into grid indices for the point products (map labels, text forecasts, meteograms, skewts).
+# ll_to_xy re-reads the projection off the file every time it's called, so we run it once for every station we know about
+# and hand back indices (and bilinear weights) for any number of stations as arrays.
+
+import numpy as np
+from wrf import ll_to_xy, to_np
+
+class StationIndex:
+    def __init__(self, wrf_file):
+        self.wrf_file = wrf_file
+        self.shape = wrf_file.variables["XLAT"].shape[-2:]
+        # (lat, lon) -> fractional (x, y) grid position
+        self.points = {}
+
+    def locate(self, coords):
+        # coords is a list of (lat, lon). stations we haven't seen yet get looked up together in one ll_to_xy call.
+        coords = [tuple(c) for c in coords]
+        new = [c for c in dict.fromkeys(coords) if c not in self.points]
+        if new:
+            lats, lons = zip(*new)
+            xy = to_np(ll_to_xy(self.wrf_file, list(lats), list(lons), as_int=False)).reshape(2, -1)
+            for c, x, y in zip(new, xy[0], xy[1]):
+                self.points[c] = (float(x), float(y))
+        xy = np.array([self.points[c] for c in coords], dtype=float).reshape(-1, 2)
+        return xy[:, 0], xy[:, 1]
+
+    def indices(self, coords):
+        # nearest grid point, the same x, y that ll_to_xy hands back by default
+        x, y = self.locate(coords)
+        return np.rint(x).astype(int), np.rint(y).astype(int)
+
+    def point(self, coords):
+        x, y = self.indices([coords])
+        return int(x[0]), int(y[0])
+
+    def inside(self, x, y):
+        ny, nx = self.shape
+        return (x >= 0) & (x < nx) & (y >= 0) & (y < ny)
+
+    def weights(self, coords):
+        # lower-left corner of the cell each station falls in, plus the weights on its four corners
+        # (lower left, lower right, upper left, upper right)
+        ny, nx = self.shape
+        x, y = self.locate(coords)
+        x0 = np.clip(np.floor(x).astype(int), 0, nx - 2)
+        y0 = np.clip(np.floor(y).astype(int), 0, ny - 2)
+        fx = np.clip(x - x0, 0, 1)
+        fy = np.clip(y - y0, 0, 1)
+        w = np.stack([(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy])
+        return x0, y0, w
+
+    def nearest(self, field, coords):
+        # field is (..., south_north, west_east). stations off the grid come back as nan
+        field = np.asarray(field)
+        x, y = self.indices(coords)
+        ok = self.inside(x, y)
+        values = np.full(field.shape[:-2] + (len(x),), np.nan, dtype=np.result_type(field.dtype, np.float32))
+        values[..., ok] = field[..., y[ok], x[ok]]
+        return values
+
+    def bilinear(self, field, coords):
+        field = np.asarray(field)
+        x, y = self.locate(coords)
+        x0, y0, w = self.weights(coords)
+        values = (w[0] * field[..., y0, x0] + w[1] * field[..., y0, x0 + 1]
+                  + w[2] * field[..., y0 + 1, x0] + w[3] * field[..., y0 + 1, x0 + 1])
+        ny, nx = self.shape
+        ok = (x >= 0) & (x <= nx - 1) & (y >= 0) & (y <= ny - 1)
+        return np.where(ok, values, np.nan)
+
+def get_station_index(wrf_file, cache=None):
+    # one index per wrfout/domain, kept on the field cache so every product in the process shares it
+    if cache is None:
+        return StationIndex(wrf_file)
+    return cache.stage("station_index", lambda: StationIndex(wrf_file))
@@ -0,0 +1,43 @@
+# This module traces streamlines once and draws them onto as many maps as want them.
+# cartopy's regrid and matplotlib's integrator are the slow part of the wind maps, and they come out the same for every product
+# at the same level, hour and map view (wind and wind_gust both draw the 10m ones), so the trajectories are kept as one
+# nan-separated (n, 2) array in the map's projection, which caches and stores like any other field, and redrawn as a LineCollection.
+
+import hashlib
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+from matplotlib.patches import FancyArrowPatch
+from cartopy.vector_transform import vector_scalar_to_grid
+
+def view_tag(ax, pressure_level):
+    # the trajectories are in the map's projection and only cover its current view, so both go in the key with the level
+    extent = tuple(round(v, 3) for v in ax.get_extent(ax.projection))
+    view = hashlib.sha1(repr((ax.projection.proj4_init, extent)).encode()).hexdigest()[:12]
+    return f"{pressure_level or 'sfc'}-{view}"
+
+def trace_streamlines(projection, extent, x, y, u, v, density=1):
+    # what GeoAxes.streamplot does (regrid onto an even grid over the view, then integrate), on a throwaway axes
+    shape = [int(30 * density)] * 2
+    x, y, u, v = vector_scalar_to_grid(projection, projection, shape, x, y, u, v, target_extent=extent)
+    lines = Figure().add_subplot().streamplot(x, y, u, v, density=density).lines
+    pieces = []
+    for line in lines.get_segments():
+        pieces += [line, np.full((1, 2), np.nan)]
+    return np.concatenate(pieces) if pieces else np.empty((0, 2))
+
+def split_lines(points):
+    pieces = np.split(points, np.flatnonzero(np.isnan(points[:, 0])))
+    lines = [piece[~np.isnan(piece[:, 0])] for piece in pieces]
+    return [line for line in lines if len(line) > 1]
+
+def draw_streamlines(ax, points, color="k", linewidth=1, arrowsize=1, zorder=2):
+    # same look as streamplot: the lines plus one arrow halfway along each
+    lines = split_lines(points)
+    ax.add_collection(LineCollection(lines, colors=color, linewidths=linewidth, zorder=zorder, transform=ax.transData), autolim=False)
+    for line in lines:
+        tx, ty = line.T
+        s = np.cumsum(np.hypot(np.diff(tx), np.diff(ty)))
+        i = np.searchsorted(s, s[-1] / 2)
+        ax.add_patch(FancyArrowPatch((tx[i], ty[i]), (np.mean(tx[i:i + 2]), np.mean(ty[i:i + 2])), transform=ax.transData,
+                                     arrowstyle="-|>", mutation_scale=10 * arrowsize, color=color, linewidth=linewidth, zorder=zorder))
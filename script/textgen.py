@@ -1,26 +1,26 @@
 # This module generates our text forecasts.
 
-from wrf import getvar, to_np, ll_to_xy
+from stations import StationIndex
+from pointseries import extract_point_series
 import numpy as np
 
-def get_text_data(wrf_file, airport, coords, hours, forecast_times, run_time):
+def get_text_data(wrf_file, airport, coords, hours, forecast_times, run_time, station_index=None, series=None):
+    # series is this airport's table from pointseries.extract_point_series, pulled here if the caller didn't already
     forecast_time = forecast_times[1].strftime("%Y-%m-%d %H:%M UTC")
-    x, y = ll_to_xy(wrf_file, coords[0], coords[1])
+    if series is None:
+        if station_index is None:
+            station_index = StationIndex(wrf_file)
+        series = extract_point_series(wrf_file, {airport: coords}, station_index)[airport]
     output_lines = []
     output_lines.append(f"UGA-WRF {run_time} - Init: {forecast_times[0]} - Text Forecast for {airport.upper()}")
     output_lines.append(f"Forecast Start Time: {forecast_time}")
     output_lines.append(f"UTC (Fcst) Hr | Temp | Dewp | Wind (dir) | Pressure")
     for t in range(1, hours):
-        t_data = getvar(wrf_file, "T2", timeidx=t)[y, x].values
-        td_data = getvar(wrf_file, "td2", timeidx=t)[y, x].values
-        wspd_data = getvar(wrf_file, "wspd_wdir10", timeidx=t, units="mph")
-        pressure_data = getvar(wrf_file, "AFWA_MSLP", timeidx=t)[y, x].values
-        t_f = (t_data - 273.15) * 9/5 + 32
-        td = td_data * 9/5 + 32
-        wspd = to_np(wspd_data[0][y, x])
-        wdir = to_np(wspd_data[1][y, x])
-        pressure_mb = to_np(pressure_data) / 100
-        output_lines.append(f"{forecast_times[t].strftime('%H UTC')} ({str(t).zfill(2)}) | {t_f:.1f} F | {td:.1f} F | {wspd:.1f} mph {deg_to_cardinal(wdir)} | {pressure_mb:.1f} mb")
+        t_f = series["temp_f"][t]
+        td = series["dewpoint_f"][t]
+        wspd = series["wspd_mph"][t]
+        pressure_mb = series["mslp_mb"][t]
+        output_lines.append(f"{forecast_times[t].strftime('%H UTC')} ({str(t).zfill(2)}) | {t_f:.1f} F | {td:.1f} F | {wspd:.1f} mph {series['cardinal'][t]} | {pressure_mb:.1f} mb")
     return output_lines
 
 def deg_to_cardinal(deg):
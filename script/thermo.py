@@ -0,0 +1,402 @@
+# This module is our vectorized sounding thermodynamics: parcel profiles, LCL/LFC/EL, SB/ML/MU CAPE and CIN, K index and total totals.
+# everything works on a whole batch of columns at once ((..., level) arrays, e.g. every skewt station for an hour),
+# instead of going through metpy and pint one sounding at a time.
+# it follows metpy's formulas and conventions (virtual temperature correction, bottom LFC/top EL, 50 hPa MU layer, 100 hPa mixed layer)
+# and is checked against metpy when this file is run directly (python thermo.py) - see TOLERANCES and check_against_metpy.
+
+import numpy as np
+from scipy.special import lambertw
+from metpy.constants import nounit as mpconsts
+
+RD = mpconsts.Rd
+RV = mpconsts.Rv
+CP_D = mpconsts.Cp_d
+CP_V = mpconsts.Cp_v
+CP_L = mpconsts.Cp_l
+LV = mpconsts.Lv
+T0 = mpconsts.T0
+ZERO_DEGC = mpconsts.zero_degc
+SAT_PRESSURE_0C = mpconsts.sat_pressure_0c
+EPSILON = mpconsts.epsilon
+KAPPA = mpconsts.kappa
+P0 = 100000.0
+
+# step size (in ln p) for the moist adiabat integration, about 2% in pressure
+MOIST_STEP = 0.02
+
+# pressures are in Pa and temperatures in K inside this module, the public functions take hPa/degC like the skewts use
+
+def saturation_vapor_pressure(t):
+    latent_heat = LV - (CP_L - CP_V) * (t - T0)
+    heat_power = (CP_L - CP_V) / RV
+    exp_term = (LV / T0 - latent_heat / t) / RV
+    return SAT_PRESSURE_0C * (T0 / t) ** heat_power * np.exp(exp_term)
+
+def saturation_mixing_ratio(p, t):
+    e_s = saturation_vapor_pressure(t)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(e_s >= p, np.nan, EPSILON * e_s / (p - e_s))
+
+def virtual_temperature(t, w):
+    return t * ((w + EPSILON) / (EPSILON * (1 + w)))
+
+def dry_lapse(p, t, p_start):
+    return t * (p / p_start) ** KAPPA
+
+def lcl(p, t, td):
+    # Romps (2017) exact LCL, same as metpy
+    w = saturation_mixing_ratio(p, td)
+    q = w / (1 + w)
+    moist_heat_ratio = (CP_D + q * (CP_V - CP_D)) / (RD + q * (RV - RD))
+    spec_heat_diff = CP_L - CP_V
+    a = moist_heat_ratio + spec_heat_diff / RV
+    b = -(LV + spec_heat_diff * T0) / (RV * t)
+    c = b / a
+    rh = saturation_vapor_pressure(td) / saturation_vapor_pressure(t)
+    with np.errstate(invalid="ignore"):
+        w_minus1 = lambertw(rh ** (1 / a) * c * np.exp(c), k=-1).real
+    t_lcl = c / w_minus1 * t
+    p_lcl = p * (t_lcl / t) ** moist_heat_ratio
+    return p_lcl, t_lcl
+
+def _moist_gradient(lnp, t):
+    # dT/dln(p) along a moist pseudo-adiabat
+    rs = saturation_mixing_ratio(np.exp(lnp), t)
+    return (RD * t + LV * rs) / (CP_D + LV * LV * rs * EPSILON / (RD * t ** 2))
+
+def moist_lapse(p, t_start, p_start):
+    # p is (N, L) decreasing, t_start/p_start are (N,). levels above p_start get the moist adiabat from there, the rest are nan.
+    # RK4 in ln(p), marching up level by level so every column steps together
+    out = np.full(p.shape, np.nan)
+    lnp_now = np.log(p_start)
+    t_now = np.array(t_start, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lnp = np.log(p)
+    for k in range(p.shape[1]):
+        go = np.isfinite(lnp[:, k]) & (lnp[:, k] < lnp_now)
+        if not go.any():
+            continue
+        delta = np.where(go, lnp[:, k] - lnp_now, 0)
+        steps = int(np.ceil(np.max(np.abs(delta)) / MOIST_STEP))
+        h = delta / steps
+        x = lnp_now.copy()
+        for _ in range(steps):
+            k1 = _moist_gradient(x, t_now)
+            k2 = _moist_gradient(x + h / 2, t_now + h / 2 * k1)
+            k3 = _moist_gradient(x + h / 2, t_now + h / 2 * k2)
+            k4 = _moist_gradient(x + h, t_now + h * k3)
+            t_now = t_now + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            x = x + h
+        lnp_now = np.where(go, lnp[:, k], lnp_now)
+        out[:, k] = np.where(go, t_now, np.nan)
+    return out
+
+def parcel_profile(p, t_start, td_start):
+    # dry adiabat from the first level up to the LCL, moist adiabat above it
+    p_start = p[:, 0]
+    p_lcl, t_lcl = lcl(p_start, t_start, td_start)
+    moist = moist_lapse(p, dry_lapse(p_lcl, t_start, p_start), p_lcl)
+    dry = dry_lapse(p, t_start[:, None], p_start[:, None])
+    with np.errstate(invalid="ignore"):
+        return np.where(p >= p_lcl[:, None], dry, moist), p_lcl, t_lcl
+
+def _compact(*arrays):
+    # drop any level that's nan in any of the arrays, shifting what's left down to the bottom of each row (metpy's _remove_nans)
+    valid = np.all([np.isfinite(a) for a in arrays], axis=0)
+    order = np.argsort(~valid, axis=1, kind="stable")
+    valid = np.take_along_axis(valid, order, axis=1)
+    return [np.where(valid, np.take_along_axis(a, order, axis=1), np.nan) for a in arrays]
+
+def _interp_linear(level, p, field):
+    # field at pressure level (N,) from decreasing p (N, L), linear in p, nan outside the column
+    k = np.count_nonzero(p >= level[:, None], axis=1) - 1
+    k1 = np.clip(k + 1, 0, p.shape[1] - 1)
+    k0 = np.clip(k, 0, p.shape[1] - 1)
+    rows = np.arange(p.shape[0])
+    p0, p1 = p[rows, k0], p[rows, k1]
+    f0, f1 = field[rows, k0], field[rows, k1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        exact = np.isclose(p0, level)
+        out = np.where(exact, f0, f0 + (level - p0) * (f1 - f0) / (p1 - p0))
+    return np.where(exact | ((k >= 0) & (k1 > k0) & (p1 < level)), out, np.nan)
+
+def _insert_lcl(p, t, td, prof, p_lcl, t_lcl):
+    # metpy's parcel_profile_with_lcl: the LCL goes in right above every level at or below it,
+    # with the environment linearly interpolated to it (nan, and dropped later, if it's off the top of the column)
+    levels = p.shape[1]
+    with np.errstate(invalid="ignore"):
+        loc = np.count_nonzero(p >= p_lcl[:, None], axis=1)
+    j = np.arange(levels + 1)[None, :]
+    src = np.clip(np.where(j < loc[:, None], j, j - 1), 0, levels - 1)
+    at = j == loc[:, None]
+    def insert(field, value):
+        return np.where(at, value[:, None], np.take_along_axis(field, src, axis=1))
+    return [insert(p, p_lcl), insert(t, _interp_linear(p_lcl, p, t)), insert(td, _interp_linear(p_lcl, p, td)), insert(prof, t_lcl)]
+
+def _crossings(lnp, a, b, start):
+    # where a - b changes sign between consecutive levels (segments k >= start), in ln(p), plus a's value there and the direction
+    d = a - b
+    d0, d1 = d[:, :-1], d[:, 1:]
+    x0, x1 = lnp[:, :-1], lnp[:, 1:]
+    s0, s1 = np.sign(d0), np.sign(d1)
+    seg = np.arange(d0.shape[1])[None, :]
+    change = np.isfinite(d0) & np.isfinite(d1) & (s0 != s1) & (seg >= np.asarray(start).reshape(-1, 1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x = (d1 * x0 - d0 * x1) / (d1 - d0)
+        y = (x - x0) / (x1 - x0) * (a[:, 1:] - a[:, :-1]) + a[:, :-1]
+    return x, y, s1, change & np.isfinite(x)
+
+def _pick(mask, values, which):
+    # first ('bottom') or last ('top') value along each row where mask is set, nan if there's none
+    rows = np.arange(mask.shape[0])
+    if which == "bottom":
+        idx = np.argmax(mask, axis=1)
+    else:
+        idx = mask.shape[1] - 1 - np.argmax(mask[:, ::-1], axis=1)
+    return np.where(mask.any(axis=1), values[rows, idx], np.nan)
+
+def _less_or_close(a, b):
+    return (a < b) | np.isclose(a, b)
+
+def _greater_or_close(a, b):
+    return (a > b) | np.isclose(a, b)
+
+def _lfc(p, t, td, prof, which):
+    lnp = np.log(p)
+    start = np.where(np.isclose(prof[:, 0], t[:, 0]), 1, 0)
+    x, y, direction, change = _crossings(lnp, prof, t, start)
+    increasing = change & (direction > 0)
+    this_lcl_p, this_lcl_t = lcl(p[:, 0], prof[:, 0], td[:, 0])
+    valid = np.isfinite(p)
+    with np.errstate(invalid="ignore", over="ignore"):
+        # no crossings at all: the LFC is the LCL if there's any positive area above it
+        above = valid & (p < this_lcl_p[:, None])
+        positive = (above & ~_less_or_close(prof, t)).any(axis=1)
+        xp = np.exp(x)
+        above_lcl = increasing & (xp < this_lcl_p[:, None])
+        # crossings, but all of them below the LCL: no LFC if the EL is below the LCL too
+        decreasing = change & (direction < 0) & (np.arange(x.shape[1])[None, :] >= 1)
+        el_low = np.where(decreasing, xp, np.inf).min(axis=1)
+    none_p = np.where(positive, this_lcl_p, np.nan)
+    none_t = np.where(positive, this_lcl_t, np.nan)
+    below_ok = ~(decreasing.any(axis=1) & (el_low > this_lcl_p))
+    below_p = np.where(below_ok, this_lcl_p, np.nan)
+    below_t = np.where(below_ok, this_lcl_t, np.nan)
+    lfc_p = np.where(~increasing.any(axis=1), none_p, np.where(~above_lcl.any(axis=1), below_p, _pick(above_lcl, xp, which)))
+    lfc_t = np.where(~increasing.any(axis=1), none_t, np.where(~above_lcl.any(axis=1), below_t, _pick(above_lcl, y, which)))
+    return lfc_p, lfc_t
+
+def _el(p, t, td, prof, top):
+    rows = np.arange(p.shape[0])
+    warm_top = prof[rows, top] > t[rows, top]
+    x, y, direction, change = _crossings(np.log(p), prof, t, 1)
+    decreasing = change & (direction < 0)
+    lcl_p, _ = lcl(p[:, 0], t[:, 0], td[:, 0])
+    last = np.exp(_pick(decreasing, x, "top"))
+    with np.errstate(invalid="ignore"):
+        return np.where(~warm_top & (last < lcl_p), last, np.nan)
+
+def _cape_cin(p, t, td, prof, p_lcl):
+    # metpy's cape_cin on compacted columns that already have the LCL level in them
+    rows = np.arange(p.shape[0])
+    top = np.count_nonzero(np.isfinite(p), axis=1) - 1
+    with np.errstate(invalid="ignore"):
+        below_lcl = p > p_lcl[:, None]
+    parcel_w = np.where(below_lcl, saturation_mixing_ratio(p[:, :1], td[:, :1]), saturation_mixing_ratio(p, prof))
+    tv = virtual_temperature(t, saturation_mixing_ratio(p, td))
+    prof_v = virtual_temperature(prof, parcel_w)
+    lfc_p, _ = _lfc(p, tv, td, prof_v, "bottom")
+    el_p = _el(p, tv, td, prof_v, top)
+    el_p = np.where(np.isnan(el_p), p[rows, top], el_p)
+    # the profiles are piecewise linear in ln(p), and the zero crossings split each segment into pieces
+    # (metpy doesn't add a crossing in the bottom segment, so neither do we).
+    # each piece counts toward CAPE/CIN if both of its ends are inside the layer, same as metpy's masked trapezoid
+    lnp = np.log(p)
+    y = prof_v - tv
+    cross_x, _, _, crosses = _crossings(lnp, prof_v, tv, 1)
+    s_x, s_y = lnp[:, :-1], y[:, :-1]
+    e_x, e_y = lnp[:, 1:], y[:, 1:]
+    m_x = np.where(crosses, cross_x, e_x)
+    m_y = np.where(crosses, 0.0, e_y)
+    segment = np.isfinite(s_y) & np.isfinite(e_y)
+    def area(bottom, top_p):
+        def inside(lx):
+            px = np.exp(lx)
+            return _less_or_close(px, bottom[:, None]) & _greater_or_close(px, top_p[:, None])
+        with np.errstate(invalid="ignore"):
+            first = np.where(segment & inside(s_x) & inside(m_x), 0.5 * (s_y + m_y) * (s_x - m_x), 0)
+            second = np.where(segment & crosses & inside(m_x) & inside(e_x), 0.5 * (m_y + e_y) * (m_x - e_x), 0)
+        return RD * np.nansum(first + second, axis=1)
+    cape = area(lfc_p, el_p)
+    cin = np.minimum(area(np.full_like(lfc_p, np.inf), lfc_p), 0)
+    no_lfc = np.isnan(lfc_p)
+    return np.where(no_lfc, 0.0, cape), np.where(no_lfc, 0.0, cin)
+
+def _parcel_cape_cin(p, t, td):
+    # lift the parcel at the first level of each (compacted) column
+    prof, p_lcl, t_lcl = parcel_profile(p, t[:, 0], td[:, 0])
+    pi, ti, tdi, profi = _compact(*_insert_lcl(p, t, td, prof, p_lcl, t_lcl))
+    return _cape_cin(pi, ti, tdi, profi, p_lcl)
+
+def _shift(start, *arrays):
+    # start each row at its own level index, padding the top with nan
+    j = np.arange(arrays[0].shape[1])[None, :] + start[:, None]
+    ok = j < arrays[0].shape[1]
+    j = np.minimum(j, arrays[0].shape[1] - 1)
+    return [np.where(ok, np.take_along_axis(a, j, axis=1), np.nan) for a in arrays]
+
+def equivalent_potential_temperature(p, t, td):
+    r = saturation_mixing_ratio(p, td)
+    e = saturation_vapor_pressure(td)
+    t_l = 56 + 1. / (1. / (td - 56) + np.log(t / td) / 800.)
+    th_l = t / ((p - e) / P0) ** KAPPA * (t / t_l) ** (0.28 * r)
+    return th_l * np.exp(r * (1 + 0.448 * r) * (3036. / t_l - 1.78))
+
+def _most_unstable_start(p, t, td, depth):
+    # highest theta-e within depth of the bottom, using the level nearest the top of the layer rather than interpolating
+    rows = np.arange(p.shape[0])
+    top = p[rows, np.nanargmin(np.abs(p - (p[:, :1] - depth)), axis=1)]
+    with np.errstate(invalid="ignore"):
+        layer = _less_or_close(p, p[:, :1]) & _greater_or_close(p, top[:, None])
+    theta_e = np.where(layer, equivalent_potential_temperature(p, t, td), -np.inf)
+    return np.argmax(theta_e, axis=1)
+
+def _mixed_parcel(p, t, td, depth):
+    # layer-mean potential temperature and mixing ratio over the bottom depth Pa, trapezoid in p with the top interpolated in ln(p)
+    p_start = p[:, 0]
+    top = p_start - depth
+    theta = t / (p / P0) ** KAPPA
+    w = saturation_mixing_ratio(p, td)
+    lnp = np.log(p)
+    p0, p1 = p[:, :-1], p[:, 1:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        frac = (np.log(top)[:, None] - lnp[:, :-1]) / (lnp[:, 1:] - lnp[:, :-1])
+        whole = _greater_or_close(p1, top[:, None])
+        partial = (p0 > top[:, None]) & ~whole
+    means = []
+    for field in (theta, w):
+        f0, f1 = field[:, :-1], field[:, 1:]
+        f_top = f0 + frac * (f1 - f0)
+        with np.errstate(invalid="ignore"):
+            piece = np.where(whole, 0.5 * (f0 + f1) * (p0 - p1), np.where(partial, 0.5 * (f0 + f_top) * (p0 - top[:, None]), 0))
+        means.append(np.nansum(piece, axis=1) / depth)
+    mean_theta, mean_w = means
+    t_parcel = mean_theta * (p_start / P0) ** KAPPA
+    e = p_start * mean_w / (EPSILON + mean_w)
+    val = np.log(e / SAT_PRESSURE_0C)
+    td_parcel = ZERO_DEGC + 243.5 * val / (17.67 - val)
+    return t_parcel, td_parcel
+
+def parcel_indices(pressure, tc, td, mu_depth=50, ml_depth=100):
+    # pressure (hPa), tc and td (degC) are (..., level) with pressure decreasing along the last axis.
+    # returns {name: array} with the leading shape, plus "parcel" (the surface parcel's temperature at every level, degC)
+    shape = np.shape(pressure)
+    p = np.asarray(pressure, dtype=np.float64).reshape(-1, shape[-1]) * 100
+    t = np.asarray(tc, dtype=np.float64).reshape(-1, shape[-1]) + ZERO_DEGC
+    d = np.asarray(td, dtype=np.float64).reshape(-1, shape[-1]) + ZERO_DEGC
+    p, t, d = _compact(p, t, d)
+    out = {}
+
+    # surface based
+    prof, p_lcl, t_lcl = parcel_profile(p, t[:, 0], d[:, 0])
+    pi, ti, tdi, profi = _compact(*_insert_lcl(p, t, d, prof, p_lcl, t_lcl))
+    out["sbcape"], out["sbcin"] = _cape_cin(pi, ti, tdi, profi, p_lcl)
+    # the LFC drawn on the skewt is metpy.calc.lfc's default: no virtual temperature correction, topmost LFC
+    lfc_p, lfc_t = _lfc(pi, ti, tdi, profi, "top")
+    out["lcl_pressure"], out["lcl_temperature"] = p_lcl / 100, t_lcl - ZERO_DEGC
+    out["lfc_pressure"], out["lfc_temperature"] = lfc_p / 100, lfc_t - ZERO_DEGC
+
+    # most unstable parcel in the lowest mu_depth hPa
+    start = _most_unstable_start(p, t, d, mu_depth * 100)
+    out["mucape"], out["mucin"] = _parcel_cape_cin(*_shift(start, p, t, d))
+
+    # mixed layer parcel over the lowest ml_depth hPa, lifted from the surface through the levels above the layer
+    t_ml, td_ml = _mixed_parcel(p, t, d, ml_depth * 100)
+    first = np.arange(p.shape[1])[None, :] == 0
+    keep = first | (p < (p[:, :1] - ml_depth * 100))
+    pm, tm, dm = _compact(np.where(keep, p, np.nan), np.where(first, t_ml[:, None], t), np.where(first, td_ml[:, None], d))
+    out["mlcape"], out["mlcin"] = _parcel_cape_cin(pm, tm, dm)
+
+    t850, t700, t500 = (_interp_linear(np.full(p.shape[0], level * 100.0), p, t) for level in (850, 700, 500))
+    td850, td700 = (_interp_linear(np.full(p.shape[0], level * 100.0), p, d) for level in (850, 700))
+    out["k_index"] = (t850 - t500) + (td850 - ZERO_DEGC) - (t700 - td700)
+    out["total_totals"] = (t850 - t500) + (td850 - t500)
+
+    result = {name: value.reshape(shape[:-1]) for name, value in out.items()}
+    # parcel profile back on the original levels (compaction only ever moves nan levels to the top)
+    result["parcel"] = (prof - ZERO_DEGC).reshape(shape)
+    return result
+
+# tolerances check_against_metpy holds us to: J/kg for CAPE/CIN (or 0.5%, whichever is bigger), hPa, and degC
+TOLERANCES = {"cape": (1.0, 0.005), "pressure": 0.1, "temperature": 0.01}
+
+def synthetic_soundings(count, levels=45, seed=0):
+    # a spread of stable, capped and unstable soundings for the metpy comparison
+    rng = np.random.default_rng(seed)
+    pressure, tc, td = [], [], []
+    for _ in range(count):
+        p_sfc = rng.uniform(950, 1020)
+        p = np.linspace(p_sfc, 100, levels)
+        z = np.log(p_sfc / p) * 7.5
+        t = rng.uniform(-5, 35) - rng.uniform(4, 8.5) * np.minimum(z, rng.uniform(10, 12))
+        t = np.maximum(t, -75) + rng.normal(0, 0.3, levels)
+        if rng.random() < 0.4:
+            t[1:5] += rng.uniform(0, 5)
+        pressure.append(p)
+        tc.append(t)
+        td.append(t - rng.uniform(0, 15) - z * rng.uniform(0, 6))
+    return np.array(pressure, np.float32), np.array(tc, np.float32), np.array(td, np.float32)
+
+def check_against_metpy(pressure, tc, td):
+    # run parcel_indices and metpy on the same (N, level) soundings, returns {name: worst difference} and whether it's all within TOLERANCES
+    import warnings
+    import metpy.calc as mpcalc
+    from metpy.units import units
+    ours = parcel_indices(pressure, tc, td)
+    worst = {}
+    ok = True
+    for i in range(len(pressure)):
+        p = pressure[i] * units.hPa
+        t = tc[i] * units.degC
+        d = td[i] * units.degC
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            sb = mpcalc.surface_based_cape_cin(p, t, d)
+            mu = mpcalc.most_unstable_cape_cin(p, t, d, depth=50 * units.hPa)
+            ml = mpcalc.mixed_layer_cape_cin(p, t, d)
+            lcl_p, lcl_t = mpcalc.lcl(p[0], t[0], d[0])
+            lfc_p, lfc_t = mpcalc.lfc(p, t, d)
+            parcel = mpcalc.parcel_profile(p, t[0], d[0]).to("degC").m
+        theirs = {
+            "sbcape": sb[0].m, "sbcin": sb[1].m, "mucape": mu[0].m, "mucin": mu[1].m, "mlcape": ml[0].m, "mlcin": ml[1].m,
+            "lcl_pressure": lcl_p.to("hPa").m, "lcl_temperature": lcl_t.to("degC").m,
+            "lfc_pressure": lfc_p.to("hPa").m, "lfc_temperature": lfc_t.to("degC").m,
+            "k_index": mpcalc.k_index(p, t, d).to("degC").m, "total_totals": mpcalc.total_totals_index(p, t, d).to("delta_degC").m,
+        }
+        for name, value in theirs.items():
+            mine = ours[name][i]
+            if np.isnan(value) or np.isnan(mine):
+                diff = 0.0 if np.isnan(value) and np.isnan(mine) else np.inf
+            else:
+                diff = abs(float(mine) - float(value))
+            if "cape" in name or "cin" in name:
+                absolute, relative = TOLERANCES["cape"]
+                ok &= diff <= max(absolute, relative * abs(float(value)))
+            else:
+                ok &= diff <= TOLERANCES["pressure" if "pressure" in name else "temperature"]
+            worst[name] = max(worst.get(name, 0.0), diff)
+        parcel_diff = float(np.nanmax(np.abs(parcel - ours["parcel"][i])))
+        ok &= parcel_diff <= TOLERANCES["temperature"]
+        worst["parcel"] = max(worst.get("parcel", 0.0), parcel_diff)
+    return worst, ok
+
+if __name__ == "__main__":
+    import time
+    soundings = synthetic_soundings(200)
+    start = time.perf_counter()
+    parcel_indices(*soundings)
+    print(f"parcel_indices on {len(soundings[0])} soundings: {time.perf_counter() - start:.3f}s")
+    worst, ok = check_against_metpy(*soundings)
+    for name, diff in worst.items():
+        print(f"{name}: worst difference from metpy {diff:.4f}")
+    print("within tolerance" if ok else "OUT OF TOLERANCE")
@@ -2,13 +2,23 @@ import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
 import os
+import atexit
 import argparse
 from pathlib import Path
 from netCDF4 import Dataset
-from wrf import extract_times, ll_to_xy
+from wrf import extract_times
 import numpy as np
 import datetime as dt
 import json
+from fieldcache import FieldCache
+from derivedstore import DerivedStore, wrfout_identity
+from manifest import OutputManifest, frame_files
+from prefetch import Prefetcher, tune_chunk_cache
+import basemapcache
+import imagewriter
+from stations import get_station_index
+from pointseries import extract_point_series
+from soundings import Soundings
 
 # Specify your wrfout and output folder in the commandline. Arg1 is your wrfout, arg2 is where you plan to store the products created.
 # If you do not specify one, it will try to use the defaults of (parent folder)/site/runs for your image output
@@ -18,55 +28,19 @@ parser.add_argument('wrf_file', type=str, help='Path to the wrfout file.')
 parser.add_argument('output_folder', type=str, nargs='?', help='Base output folder for products. Defaults to ../site/runs.', default=None)
 parser.add_argument('-r', '--run_flags', type=str, nargs='?', help='Run flags to disable certain products. See comments in file for more info.', default="0")
 parser.add_argument('-p', '--partial', help='Denotes this is a partial wrfout (i.e. one that is only one hour long) and skips plots that require multiple hours like 1-hour temp change.', action='store_true')
-args = parser.parse_args()
-print(args)
-try:
-    WRF_FILE = args.wrf_file
-except:
-    root_dir = Path(__file__).resolve().parent
-    WRF_FILE = root_dir / "wrfout_d01_2025-03-13_21_00_00"
-try:
-    if args.output_folder == None:
-        BASE_OUTPUT = Path(__file__).resolve().parent.parent / "site" / "runs"
-    else:
-        BASE_OUTPUT = args.output_folder
-except:
-    root_dir = Path(__file__).resolve().parent.parent
-    BASE_OUTPUT = root_dir / "site" / "runs"
-
-# use run flags, arg3 to specify if you want to disable a certain product or not. This is useful for debugging/concurrent running.
-# 1 - textgen
-# 2 - weathermaps
-# 3 - special
-# 4 - meteogram
-# 5 - skewt
-# ex: python.exe ugawrf.py "D:\ugawrf_fork\ugawrf\wrfout_d01_2025-03-13_21_00_00" default "245"
-# this will run all modules except for meteogram and skewt
-run_flags = args.run_flags
-
-
-# processing modules - located in the same folder as (module).py
-# if you want to skip generating a certain product, just comment out the module
-modules_enabled = []
-if "1" not in run_flags:
-    import textgen
-    modules_enabled.append("textgen")
-if "2" not in run_flags:
-    import weathermaps
-    modules_enabled.append("weathermaps")
-if "3" not in run_flags:
-    import special
-    modules_enabled.append("special")
-if "4" not in run_flags:
-    import meteogram
-    modules_enabled.append("meteogram")
-if "5" not in run_flags:
-    import skewt
-    modules_enabled.append("skewt")
-
-print("UGA-WRF Data Processing Program")
-print(f'Modules: {modules_enabled}')
-start_time = dt.datetime.now()
+parser.add_argument('-t', '--timestep_major', help='Render every map, special plot and skewt for an hour before moving on to the next one, instead of going product by product.', action='store_true')
+parser.add_argument('-w', '--workers', type=int, help='Number of worker processes to render map, special and skewt frames with. Defaults to 1 (no pool).', default=1)
+parser.add_argument('-b', '--basemap_cache', type=str, help='Folder to keep the pre-rendered county/state/border/coastline layers in. Built automatically the first time a domain is plotted. Defaults to script/basemap_cache.', default=None)
+parser.add_argument('-k', '--cape_workers', type=int, help='Number of processes to split the cape_2d diagnostic (mcape/mcin/stp/scp) across in tiles, shared out between the render workers. Defaults to 1 (no pool).', default=1)
+parser.add_argument('-f', '--prefetch', type=int, help='Read the raw wrfout variables this many hours ahead in a background process while the current hour renders. Implies --timestep_major. Ignored with a render pool. Defaults to 0 (off).', default=0)
+parser.add_argument('-d', '--derived_store', type=str, help='Folder to keep expensive diagnostics (cape, cloud fraction, upper levels) in between runs, so a rerun of the same wrfout reads them back instead of recomputing. Off by default.', default=None)
+parser.add_argument('-F', '--force', help='Redraw every map, special plot and skewt, even the ones the frame manifest says are unchanged since the last run.', action='store_true')
+parser.add_argument('-e', '--export', help='Also write the field behind every map as a quantized, deflated binary (plus a shared grid.bin) next to its PNG, for the site to render itself. See export.py.', action='store_true')
+parser.add_argument('-m', '--map_output', type=str, choices=['png', 'geojson', 'both'], help='What to write for each map: the PNG, its filled contours as simplified GeoJSON (no figure rendering), or both. Raster products (cloudcover, ptype, stargazing) always get a PNG. Defaults to png.', default='png')
+parser.add_argument('-l', '--contour_tolerance', type=float, help='How far (in degrees) GeoJSON contour outlines may be simplified. Defaults to 0.01.', default=0.01)
+parser.add_argument('-i', '--image_format', type=str, help='How to encode the map images: png, png8 (256 color palette) or webp, with an optional compression level (png:0-9, webp quality:0-100), per product if wanted, e.g. "png:3,ptype=png8,comp_reflectivity=webp:85". Defaults to png.', default='png')
+parser.add_argument('-j', '--encode_threads', type=int, help='Number of threads (per render process) encoding and writing map images while the next frame renders. Defaults to 2.', default=2)
+parser.add_argument('-c', '--cache_mb', type=int, help='Memory limit (in MB) for the field cache shared by the map and special plots. In timestep-major mode this also caps how many hours are kept in flight. Defaults to 2048.', default=2048)
 
 # --- START CONFIG --- #
 
@@ -113,9 +87,22 @@ PRODUCTS = {
     "wind_gust": "WSPD10MAX",
     "comp_reflectivity": "REFD_COM",
     "helicity": "UP_HELI_MAX",
+    #"helicity_6hr": "UP_HELI_MAX", # rolling window tracks - helicity_(hours)hr, or helicity_max(_(hours)hr) for a max composite instead of a sum
+    #"helicity_12hr": "UP_HELI_MAX",
     "mcape": "cape_2d",
     "mcin": "cape_2d",
+    "srh_1km": "ua", # gridded severe parameters, see severe.py
+    "srh_3km": "ua",
+    "shear_6km": "ua",
+    "lifted_index": "tc",
+    "k_index": "tc",
+    "total_totals": "tc",
+    "stp": "cape_2d",
+    "scp": "cape_2d",
     "1hr_precip": "AFWA_TOTPRECIP",
+    "3hr_precip": "AFWA_TOTPRECIP", # any (hours)hr_precip works, see accumulators.WindowedDifference
+    "6hr_precip": "AFWA_TOTPRECIP",
+    "12hr_precip": "AFWA_TOTPRECIP",
     "total_precip": "AFWA_TOTPRECIP",
     "1hr_snowfall": "SNOWNC",
     "snowfall": "SNOWNC",
@@ -169,128 +156,389 @@ PRODUCTS = {
 
 airports = {**high_prio_airports, **other_airports}
 
-wrf_file = Dataset(WRF_FILE)
-run_time = str(wrf_file.START_DATE).replace(":", "_")
-init_dt = dt.datetime.strptime(str(wrf_file.START_DATE), "%Y-%m-%d_%H:%M:%S")
-init_str = init_dt.strftime("%Y-%m-%d %H:%M UTC")
-domain = os.path.basename(WRF_FILE).split("_")[1]
-file_path = (run_time, domain)
-
-print(f"wrfout: {WRF_FILE}")
-print(f'image output: {BASE_OUTPUT}\{domain}')
-print(f"let's go! processing data for run {run_time}")
-
-times = extract_times(wrf_file, timeidx=None)
-def convert_time(nc_time):
-    return np.datetime64(nc_time).astype('datetime64[s]').astype(dt.datetime)
-forecast_times = [convert_time(t) for t in times]
-hours = len(times)
-
-run_metadata = {
-    "init_time": str(forecast_times[0]),
-    "domain": domain,
-    "forecast_hours": hours,
-    "products": list(PRODUCTS.keys()),
-    "in_progress": (True if args.partial else False)
-}
-json_output_path = os.path.join(BASE_OUTPUT, file_path[0], file_path[1], "metadata.json")
-os.makedirs(os.path.dirname(json_output_path), exist_ok=True)
-with open(json_output_path, "w") as json_file:
-    json.dump(run_metadata, json_file, indent=4)
-print(f"Metadata JSON saved: {json_output_path}")
-
-# processing starts here
-
-# text data
-if "textgen" in modules_enabled and not args.partial:
-    text_start_time = dt.datetime.now()
-    for airport, coords in airports.items():
-        try:
-            text_time = dt.datetime.now()
-            text_data = textgen.get_text_data(wrf_file, airport, coords, hours, forecast_times, file_path)
-            output_path = os.path.join(BASE_OUTPUT, file_path[0], file_path[1], "text", airport)
-            os.makedirs(output_path, exist_ok=True)
-            with open(os.path.join(output_path, "forecast.txt"), 'w') as f:
-                for line in text_data:
-                    f.write(f"{line}\n")
-            print(f"processed {airport} text data in {dt.datetime.now() - text_time}")
-        except Exception as e:
-            print(f"error processing {airport} text: {e}!")
-    print(f'texts processed successfuly - took {dt.datetime.now() - text_start_time}')
-elif args.partial and "textgen" in modules_enabled:
-    print('warning: partial run detected. despite text data not being skipped via run flags, this product requires a full run! skipping!')
-
-# weathermaps
-if "weathermaps" in modules_enabled:
-    map_time = dt.datetime.now()
-    for product, variable in PRODUCTS.items():
-        try:
-            times_elapsed = []
-            product_time = dt.datetime.now()
-            output_path = os.path.join(BASE_OUTPUT, file_path[0], file_path[1], product)
-            level = None
-            if "_" in product and "mb" in product:
-                level = int(product.split("_")[-1].replace("mb", ""))
-            for t in range(hours):
-                t_time = dt.datetime.now()
-                weathermaps.plot_variable(product, variable, t, output_path, forecast_times, airports, None, None, file_path, init_dt, init_str, wrf_file, level, args.partial)
-                #for loc, extent in extents.items():
-                    #weathermaps.plot_variable(product, variable, t, output_path, forecast_times, airports, loc, extent, file_path, wrf_file, level, args.partial)
-                times_elapsed.append(dt.datetime.now() - t_time)
-            avg_time = sum(times_elapsed, dt.timedelta()) / len(times_elapsed)
-            print(f"processed {product} in {dt.datetime.now() - product_time} - avg time per timestep: {avg_time}")
-        except Exception as e:
-            print(f"error processing {product}: {e}! last timestep: {t}")
-    print(f"graphics processed successfully - took {dt.datetime.now() - map_time}")
+def product_level(product):
+    # if you're plotting upper air, appending _(level)mb to the end of your folder name interps your pressure level to (level)
+    if "_" in product and "mb" in product:
+        return int(product.split("_")[-1].replace("mb", ""))
+    return None
 
-# special plots
-if "special" in modules_enabled:
-    special_plot_time = dt.datetime.now()
+def main():
+    args = parser.parse_args()
+    print(args)
     try:
+        WRF_FILE = args.wrf_file
+    except:
+        root_dir = Path(__file__).resolve().parent
+        WRF_FILE = root_dir / "wrfout_d01_2025-03-13_21_00_00"
+    try:
+        if args.output_folder == None:
+            BASE_OUTPUT = Path(__file__).resolve().parent.parent / "site" / "runs"
+        else:
+            BASE_OUTPUT = args.output_folder
+    except:
+        root_dir = Path(__file__).resolve().parent.parent
+        BASE_OUTPUT = root_dir / "site" / "runs"
+
+    # use run flags, arg3 to specify if you want to disable a certain product or not. This is useful for debugging/concurrent running.
+    # 1 - textgen
+    # 2 - weathermaps
+    # 3 - special
+    # 4 - meteogram
+    # 5 - skewt
+    # ex: python.exe ugawrf.py "D:\ugawrf_fork\ugawrf\wrfout_d01_2025-03-13_21_00_00" default "245"
+    # this will run all modules except for meteogram and skewt
+    run_flags = args.run_flags
+
+
+    # processing modules - located in the same folder as (module).py
+    # if you want to skip generating a certain product, just comment out the module
+    modules_enabled = []
+    if "1" not in run_flags:
+        import textgen
+        modules_enabled.append("textgen")
+    if "2" not in run_flags:
+        import weathermaps
+        modules_enabled.append("weathermaps")
+    if "3" not in run_flags:
+        import special
+        modules_enabled.append("special")
+    if "4" not in run_flags:
+        import meteogram
+        modules_enabled.append("meteogram")
+    if "5" not in run_flags:
+        import skewt
+        modules_enabled.append("skewt")
+
+    print("UGA-WRF Data Processing Program")
+    print(f'Modules: {modules_enabled}')
+    start_time = dt.datetime.now()
+
+    # every upper air variable/level we plot gets interpolated together once per timestep (see levelstack.py).
+    # ua/va always come along for the wind barbs, and 300mb for the stargazing seeing score.
+    upper_levels = sorted({product_level(p) for p in PRODUCTS if product_level(p)} | ({300} if "stargazing" in PRODUCTS else set()), reverse=True)
+    upper_variables = sorted({v for p, v in PRODUCTS.items() if product_level(p)} | {"ua", "va"})
+    # with a render pool, each worker tiles its own cape over its share of the cape processes
+    cape_workers = max(1, args.cape_workers)
+    field_cache = FieldCache(args.cache_mb, upper_levels, upper_variables, cape_workers)
+    if args.basemap_cache:
+        basemapcache.set_cache_dir(args.basemap_cache)
+    imagewriter.configure(args.image_format, args.encode_threads)
+
+    wrf_file = Dataset(WRF_FILE)
+    tune_chunk_cache(wrf_file)
+    run_time = str(wrf_file.START_DATE).replace(":", "_")
+    init_dt = dt.datetime.strptime(str(wrf_file.START_DATE), "%Y-%m-%d_%H:%M:%S")
+    init_str = init_dt.strftime("%Y-%m-%d %H:%M UTC")
+    domain = os.path.basename(WRF_FILE).split("_")[1]
+    file_path = (run_time, domain)
+    derived_store = os.path.join(args.derived_store, f"{domain}_{run_time}") if args.derived_store else None
+    if derived_store:
+        field_cache.store = DerivedStore(derived_store, str(WRF_FILE), wrf_file)
+    # every station we label or forecast for gets located on the grid up front, in one go
+    station_index = get_station_index(wrf_file, field_cache)
+    station_index.locate(list(airports.values()))
+    # skewt columns for every high priority airport, pulled together once per hour (see soundings.py)
+    skewt_points = {airport: station_index.point(coords) for airport, coords in high_prio_airports.items()}
+    soundings = Soundings(wrf_file, skewt_points)
+
+    print(f"wrfout: {WRF_FILE}")
+    print(f'image output: {BASE_OUTPUT}\{domain}')
+    print(f"let's go! processing data for run {run_time}")
+
+    times = extract_times(wrf_file, timeidx=None)
+    def convert_time(nc_time):
+        return np.datetime64(nc_time).astype('datetime64[s]').astype(dt.datetime)
+    forecast_times = [convert_time(t) for t in times]
+    hours = len(times)
+
+    run_metadata = {
+        "init_time": str(forecast_times[0]),
+        "domain": domain,
+        "forecast_hours": hours,
+        "products": list(PRODUCTS.keys()),
+        "in_progress": (True if args.partial else False),
+        "exported": args.export,
+        "map_output": args.map_output,
+        "image_extensions": {product: imagewriter.extension(product) for product in PRODUCTS if imagewriter.extension(product) != "png"}
+    }
+    json_output_path = os.path.join(BASE_OUTPUT, file_path[0], file_path[1], "metadata.json")
+    os.makedirs(os.path.dirname(json_output_path), exist_ok=True)
+    with open(json_output_path, "w") as json_file:
+        json.dump(run_metadata, json_file, indent=4)
+    print(f"Metadata JSON saved: {json_output_path}")
+
+    # fingerprints of every hourly frame we've drawn for this run, so reruns skip the ones whose inputs haven't changed (see manifest.py)
+    # the config above goes in too, so a moved station or a changed product entry gets its frames redrawn
+    config = dict(airports=airports, skewt_airports=sorted(high_prio_airports), products=PRODUCTS, levels=upper_levels, level_variables=upper_variables)
+    frame_inputs = dict(wrfout_identity(str(WRF_FILE), wrf_file), partial=args.partial, hours=hours, export=args.export, map_output=args.map_output, contour_tolerance=args.contour_tolerance, image_format=args.image_format, config=config)
+
+    def frame_outputs(frame):
+        return frame_files(frame, os.path.join(BASE_OUTPUT, file_path[0], file_path[1]), forecast_times, init_dt, args.map_output)
+
+    output_manifest = OutputManifest(os.path.join(os.path.dirname(json_output_path), "frames.json"), frame_inputs, args.force, frame_outputs)
+    atexit.register(output_manifest.save)
+    # maps handed to the image writer that may not be on disk yet. they only go in the manifest once record_written() has seen them written
+    queued_frames = []
+
+    def record_written():
+        # frames whose image failed to write are left out, so the next run redraws them
+        failed = imagewriter.flush()
+        for frame in queued_frames:
+            if not failed.keys() & set(frame_outputs(frame)):
+                output_manifest.record(frame)
+        queued_frames.clear()
+
+    def render_map(product, variable, t):
+        frame = ("map", product, t, (variable, product_level(product)))
+        if output_manifest.fresh(frame):
+            return
+        output_path = os.path.join(BASE_OUTPUT, file_path[0], file_path[1], product)
+        if weathermaps.plot_variable(product, variable, t, output_path, forecast_times, airports, None, None, file_path, init_dt, init_str, wrf_file, product_level(product), args.partial, field_cache, args.export, args.map_output, args.contour_tolerance):
+            queued_frames.append(frame)
+
+    def render_special(t):
+        output_path = os.path.join(BASE_OUTPUT, file_path[0], file_path[1])
+        frame = ("4panel_cloudcover", "4panel_cloudcover", t, None)
+        if not output_manifest.fresh(frame):
+            special.generate_cloud_cover(t, os.path.join(output_path, "4panel_cloudcover"), forecast_times, file_path[0], init_dt, init_str, wrf_file, field_cache)
+            output_manifest.record(frame)
+        frame = ("4panel_ptype", "4panel_ptype", t, None)
+        if not output_manifest.fresh(frame):
+            special.plot_4panel_ptype(t, os.path.join(output_path, "4panel_ptype"), forecast_times, file_path[0], init_dt, init_str, wrf_file, field_cache)
+            output_manifest.record(frame)
+
+    def render_hr24_change():
+        frame = ("24hr_change", "24hr_change", hours - 1, None)
+        if output_manifest.fresh(frame):
+            return
         output_path = os.path.join(BASE_OUTPUT, file_path[0], file_path[1])
-        if not args.partial:
-            special.hr24_change(os.path.join(output_path, "24hr_change"), airports, hours - 1, forecast_times, file_path[0], init_dt, init_str, wrf_file)
-        elif args.partial:
+        special.hr24_change(os.path.join(output_path, "24hr_change"), airports, hours - 1, forecast_times, file_path[0], init_dt, init_str, wrf_file, cache=field_cache)
+        output_manifest.record(frame)
+
+    def render_skewt(airport, x_y, t):
+        frame = ("skewt", airport, t, x_y)
+        if output_manifest.fresh(frame):
+            return
+        output_path = os.path.join(BASE_OUTPUT, file_path[0], file_path[1], "skewt", airport)
+        skewt.plot_skewt(wrf_file, x_y, t, airport, output_path, forecast_times, init_dt, init_str, file_path, soundings.get(airport, t), soundings.indices(airport, t))
+        output_manifest.record(frame)
+
+    # processing starts here
+
+    # surface time series at every airport, read once and shared by the text forecasts and meteograms
+    if ("textgen" in modules_enabled or "meteogram" in modules_enabled) and not args.partial:
+        series_time = dt.datetime.now()
+        point_series = extract_point_series(wrf_file, airports, station_index)
+        print(f"extracted point series for {len(point_series)} airports in {dt.datetime.now() - series_time}")
+
+    # text data
+    if "textgen" in modules_enabled and not args.partial:
+        text_start_time = dt.datetime.now()
+        for airport, coords in airports.items():
+            try:
+                text_time = dt.datetime.now()
+                text_data = textgen.get_text_data(wrf_file, airport, coords, hours, forecast_times, file_path, station_index, point_series[airport])
+                output_path = os.path.join(BASE_OUTPUT, file_path[0], file_path[1], "text", airport)
+                os.makedirs(output_path, exist_ok=True)
+                with open(os.path.join(output_path, "forecast.txt"), 'w') as f:
+                    for line in text_data:
+                        f.write(f"{line}\n")
+                print(f"processed {airport} text data in {dt.datetime.now() - text_time}")
+            except Exception as e:
+                print(f"error processing {airport} text: {e}!")
+        print(f'texts processed successfuly - took {dt.datetime.now() - text_start_time}')
+    elif args.partial and "textgen" in modules_enabled:
+        print('warning: partial run detected. despite text data not being skipped via run flags, this product requires a full run! skipping!')
+
+    # how the per-hour modules (weathermaps, special, skewt) get scheduled
+    if args.workers > 1:
+        hourly_mode = "parallel"
+    elif args.timestep_major or args.prefetch:
+        hourly_mode = "timestep_major"
+    else:
+        hourly_mode = "product_major"
+    hourly_modules = [m for m in ("weathermaps", "special", "skewt") if m in modules_enabled]
+    if args.prefetch and hourly_mode == "parallel":
+        print("warning: prefetch only applies to a single process run, ignoring it with a render pool")
+
+    # parallel mode: every (product, timestep) frame goes out to a pool of worker processes, each with its own wrfout handle.
+    # frames are grouped by hour so a worker's cache stays warm across the products it renders for that hour.
+    if hourly_mode == "parallel" and hourly_modules:
+        import renderpool
+        parallel_time = dt.datetime.now()
+        frames_by_hour = []
+        for t in range(hours):
+            frames = []
+            if "weathermaps" in modules_enabled:
+                frames += [("map", product, t, (variable, product_level(product))) for product, variable in PRODUCTS.items()]
+            if "special" in modules_enabled:
+                frames += [("4panel_cloudcover", "4panel_cloudcover", t, None), ("4panel_ptype", "4panel_ptype", t, None)]
+                if t == hours - 1 and not args.partial:
+                    frames.append(("24hr_change", "24hr_change", t, None))
+            if "skewt" in modules_enabled:
+                frames += [("skewt", airport, t, x_y) for airport, x_y in skewt_points.items()]
+            frames_by_hour.append([frame for frame in frames if not output_manifest.fresh(frame)])
+        run_info = {
+            "base_output": str(BASE_OUTPUT),
+            "file_path": file_path,
+            "forecast_times": forecast_times,
+            "airports": airports,
+            "init_dt": init_dt,
+            "init_str": init_str,
+            "partial": args.partial,
+            "levels": upper_levels,
+            "level_variables": upper_variables,
+            "basemap_cache": basemapcache.CACHE_DIR,
+            "skewt_points": skewt_points,
+            "cape_workers": max(1, cape_workers // args.workers),
+            "derived_store": derived_store,
+            "export": args.export,
+            "map_output": args.map_output,
+            "contour_tolerance": args.contour_tolerance,
+            "image_format": args.image_format,
+            "encode_threads": args.encode_threads,
+            "kuchera_snowfall": None,
+        }
+        if any(frame[1] in ("afwasnow_k", "4panel_ptype") for frames in frames_by_hour for frame in frames):
+            # the kuchera total is a running sum of 3d ratios, so each worker would re-walk every hour before its own.
+            # it gets worked out once here instead and handed to the workers with everything else
+            import weathermaps
+            kuchera_time = dt.datetime.now()
+            run_info["kuchera_snowfall"] = weathermaps.kuchera_totals(wrf_file, hours, field_cache)
+            print(f"kuchera snowfall totals worked out in {dt.datetime.now() - kuchera_time}")
+        print(f"rendering {sum(len(f) for f in frames_by_hour)} frames across {args.workers} workers")
+        timings, errors, written = renderpool.run_pool([frames for frames in frames_by_hour if frames], args.workers, str(WRF_FILE), max(256, args.cache_mb // args.workers), run_info)
+        for frame in written:
+            output_manifest.record(frame)
+        for name, elapsed in timings.items():
+            print(f"processed {name}: {len(elapsed)} frames - avg time per frame: {dt.timedelta(seconds=sum(elapsed) / len(elapsed))}")
+        if args.partial and "special" in modules_enabled:
             print("warning: partial run detected. 24 hour temp change plot skipped.")
+        print(f"modules {hourly_modules} processed in parallel with {len(errors)} errors - took {dt.datetime.now() - parallel_time}")
+
+    # timestep-major mode: every map, special plot and skewt for hour t gets rendered before we move on to t+1,
+    # so each hour's fields are read once and shared by every product instead of being re-read product by product.
+    if hourly_mode == "timestep_major" and hourly_modules:
+        timestep_major_time = dt.datetime.now()
+        hours_in_flight = None
+        if args.prefetch:
+            # the next hours' raw variables get read while this one renders (see prefetch.py)
+            field_cache.prefetcher = Prefetcher(str(WRF_FILE), range(hours), depth=args.prefetch)
         for t in range(hours):
-            special.generate_cloud_cover(t, os.path.join(output_path, "4panel_cloudcover"), forecast_times, file_path[0], init_dt, init_str, wrf_file)
-            special.plot_4panel_ptype(t, os.path.join(output_path, "4panel_ptype"), forecast_times, file_path[0], init_dt, init_str, wrf_file)
-        print(f"processed special plots in {dt.datetime.now() - special_plot_time}")
-    except Exception as e:
-        print(f"error processing special plots: {e}!")
-    print(f"special plots processed successfully - took {dt.datetime.now() - special_plot_time}")
-
-# meteograms
-if ("meteogram" in modules_enabled) and not args.partial:
-    meteogram_plot_time = dt.datetime.now()
-
-    for airport, coords in airports.items():
-        try:
-            meteogram_time = dt.datetime.now()
-            output_path = os.path.join(BASE_OUTPUT, file_path[0], file_path[1], "meteogram", airport)
-            meteogram.plot_meteogram(wrf_file, airport, coords, output_path, forecast_times, hours, file_path)
-            print(f"processed {airport} meteogram in {dt.datetime.now() - meteogram_time}")
-        except Exception as e:
-            print(f"error processing {airport} meteogram: {e}!")
-    print(f"meteograms processed successfully - took {dt.datetime.now() - meteogram_plot_time}")
-elif args.partial and "meteogram" in modules_enabled:
-    print('warning: partial run detected. despite meteograms not being skipped via run flags, this product requires a full run! skipping!')
+            hour_time = dt.datetime.now()
+            frames = 0
+            if "weathermaps" in modules_enabled:
+                for product, variable in PRODUCTS.items():
+                    try:
+                        render_map(product, variable, t)
+                        frames += 1
+                    except Exception as e:
+                        print(f"error processing {product}: {e}! timestep: {t}")
+            if "special" in modules_enabled:
+                try:
+                    render_special(t)
+                    frames += 2
+                    if t == hours - 1 and not args.partial:
+                        render_hr24_change()
+                        frames += 1
+                except Exception as e:
+                    print(f"error processing special plots: {e}! timestep: {t}")
+            if "skewt" in modules_enabled:
+                for airport, x_y in skewt_points.items():
+                    try:
+                        render_skewt(airport, x_y, t)
+                        frames += 1
+                    except Exception as e:
+                        print(f"error processing {airport} upper air plot: {e}! timestep: {t}")
+            if hours_in_flight is None:
+                # size the window off of how much the first hour actually needed. always keep at least the previous hour for the 1hr change products
+                hours_in_flight = max(2, field_cache.max_bytes // max(field_cache.timestep_bytes(t), 1))
+                print(f"timestep-major: keeping up to {hours_in_flight} hours in flight")
+            if t - hours_in_flight + 1 >= 0:
+                field_cache.drop_timestep(t - hours_in_flight + 1)
+            record_written()
+            print(f"processed hour {t} ({frames} frames) in {dt.datetime.now() - hour_time}")
+        if field_cache.prefetcher is not None:
+            field_cache.prefetcher.close()
+            field_cache.prefetcher = None
+        if args.partial and "special" in modules_enabled:
+            print("warning: partial run detected. 24 hour temp change plot skipped.")
+        print(f"modules {hourly_modules} processed timestep-major - took {dt.datetime.now() - timestep_major_time}")
 
-# upper air plots
-if "skewt" in modules_enabled:
-    skewt_plot_time = dt.datetime.now()
+    # weathermaps
+    if "weathermaps" in modules_enabled and hourly_mode == "product_major":
+        map_time = dt.datetime.now()
+        for product, variable in PRODUCTS.items():
+            try:
+                times_elapsed = []
+                product_time = dt.datetime.now()
+                for t in range(hours):
+                    t_time = dt.datetime.now()
+                    render_map(product, variable, t)
+                    #for loc, extent in extents.items():
+                        #weathermaps.plot_variable(product, variable, t, output_path, forecast_times, airports, loc, extent, file_path, wrf_file, level, args.partial)
+                    times_elapsed.append(dt.datetime.now() - t_time)
+                record_written()
+                avg_time = sum(times_elapsed, dt.timedelta()) / len(times_elapsed)
+                print(f"processed {product} in {dt.datetime.now() - product_time} - avg time per timestep: {avg_time}")
+            except Exception as e:
+                print(f"error processing {product}: {e}! last timestep: {t}")
+        print(f"graphics processed successfully - took {dt.datetime.now() - map_time}")
 
-    for airport, coords in high_prio_airports.items():
+    # special plots
+    if "special" in modules_enabled and hourly_mode == "product_major":
+        special_plot_time = dt.datetime.now()
         try:
-            skewt_time = dt.datetime.now()
-            x_y = ll_to_xy(wrf_file, coords[0], coords[1])
-            output_path = os.path.join(BASE_OUTPUT, file_path[0], file_path[1], "skewt", airport)
+            if not args.partial:
+                render_hr24_change()
+            elif args.partial:
+                print("warning: partial run detected. 24 hour temp change plot skipped.")
             for t in range(hours):
-                skewt.plot_skewt(wrf_file, x_y, t, airport, output_path, forecast_times, init_dt, init_str, file_path)
-            print(f"processed {airport} skewt in {dt.datetime.now() - skewt_time}")
+                render_special(t)
+            print(f"processed special plots in {dt.datetime.now() - special_plot_time}")
         except Exception as e:
-            print(f"error processing {airport} upper air plot: {e}!")
-    print(f"skewt processed successfully - took {dt.datetime.now() - skewt_plot_time}")
+            print(f"error processing special plots: {e}!")
+        print(f"special plots processed successfully - took {dt.datetime.now() - special_plot_time}")
+
+    # meteograms
+    if ("meteogram" in modules_enabled) and not args.partial:
+        meteogram_plot_time = dt.datetime.now()
+
+        for airport, coords in airports.items():
+            try:
+                meteogram_time = dt.datetime.now()
+                output_path = os.path.join(BASE_OUTPUT, file_path[0], file_path[1], "meteogram", airport)
+                meteogram.plot_meteogram(wrf_file, airport, coords, output_path, forecast_times, hours, file_path, station_index, point_series[airport])
+                print(f"processed {airport} meteogram in {dt.datetime.now() - meteogram_time}")
+            except Exception as e:
+                print(f"error processing {airport} meteogram: {e}!")
+        print(f"meteograms processed successfully - took {dt.datetime.now() - meteogram_plot_time}")
+    elif args.partial and "meteogram" in modules_enabled:
+        print('warning: partial run detected. despite meteograms not being skipped via run flags, this product requires a full run! skipping!')
+
+    # upper air plots
+    if "skewt" in modules_enabled and hourly_mode == "product_major":
+        skewt_plot_time = dt.datetime.now()
+
+        for airport, coords in high_prio_airports.items():
+            try:
+                skewt_time = dt.datetime.now()
+                x_y = skewt_points[airport]
+                for t in range(hours):
+                    render_skewt(airport, x_y, t)
+                print(f"processed {airport} skewt in {dt.datetime.now() - skewt_time}")
+            except Exception as e:
+                print(f"error processing {airport} upper air plot: {e}!")
+        print(f"skewt processed successfully - took {dt.datetime.now() - skewt_plot_time}")
+
+    print(f"field cache (main process): {field_cache.stats()}")
+    # whatever the image writer still has queued up goes to disk before the manifest says it's there
+    record_written()
+    output_manifest.save()
+    print(f"frame manifest: {output_manifest.summary()}")
+    process_time = dt.datetime.now() - start_time
+    print(f"modules {modules_enabled} processed successfully, this is run {file_path} - took {process_time}")
 
-process_time = dt.datetime.now() - start_time
-print(f"modules {modules_enabled} processed successfully, this is run {file_path} - took {process_time}")
+if __name__ == "__main__":
+    # the render, cape and prefetch pools all start new processes, which re-import this file under spawn (windows)
+    main()
@@ -1,48 +1,67 @@
 # This module plots our maps.
 
-from wrf import getvar, to_np, latlon_coords, smooth2d, ll_to_xy, interplevel
+from wrf import to_np
 import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import os
 import datetime as dt
+import functools
 import cartopy.crs as ccrs
-from metpy.plots import ctables, USCOUNTIES
-import cartopy.feature as cfeature
 from matplotlib import colors
 import numpy as np
+from fieldcache import FieldCache, convert
+from accumulators import RunningTrack, get_window
+from stations import get_station_index
+from severe import kinematic_parameters, stability_indices, composite_parameters
+from rendercontext import get_render_context, get_colortable
+from smoothing import smooth2d
+from streamlines import view_tag, trace_streamlines, draw_streamlines
+from raster import draw_raster, contour_colors
+from export import write_frame, write_grid
+from contours import write_contours, TOLERANCE
+from imagewriter import save_frame
+from matplotlib.contour import ContourSet
 
-def plot_variable(product, variable, timestep, output_path, forecast_times, airports, loc, extent, run_time, init_dt, init_str, wrf_file, level=None, partial_bool=False):
-    data = getvar(wrf_file, variable, timeidx=timestep)
-    data_copy = data.copy()
-    if level:
-        pressure = getvar(wrf_file, "pressure", timeidx=timestep)
-        data_copy = to_np(interplevel(data, pressure, level))
+PTYPE_CMAP = colors.ListedColormap(['white', 'skyblue', 'deepskyblue', 'blue', 'peachpuff', 'orange', 'darkorange', 'lightpink', 'hotpink', 'deeppink', 'lightgreen', 'green', 'darkgreen'])
+PTYPE_NORM = colors.BoundaryNorm([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13], PTYPE_CMAP.N)
+# products that work their field out themselves (see severe.py), so their configured variable is never read
+OWN_FIELD_PRODUCTS = {"srh_1km", "srh_3km", "shear_6km", "lifted_index", "k_index", "total_totals", "stp", "scp", "afwasnow_k"}
+
+def plot_variable(product, variable, timestep, output_path, forecast_times, airports, loc, extent, run_time, init_dt, init_str, wrf_file, level=None, partial_bool=False, cache=None, export_field=False, map_output="png", contour_tolerance=TOLERANCE):
+    # returns whether the frame got written (or handed to the image writer), so skipped frames don't end up in the manifest
+    if partial_bool and (product_window(product) or product == 'ptype'):
+        print(f'-> skipping {product} {timestep} due to partial flag being enabled')
+        return False
+    if cache is None:
+        cache = FieldCache()
+    # a read-only float32 array, unit conversions below make their own (float32) copy
+    data_copy = None if product in OWN_FIELD_PRODUCTS else cache.array(wrf_file, variable, timestep, level)
     valid_time = forecast_times[timestep]
     f_hour = int(round((valid_time - init_dt).total_seconds() / 3600))
     valid_time_str = valid_time.strftime("%Y-%m-%d %H:%M UTC")
-    fig, ax = plt.subplots(figsize=(12, 10), subplot_kw=dict(projection=ccrs.PlateCarree()))
-    if extent is not None:
-        ax.set_extent(extent, crs=ccrs.PlateCarree())
-    ax.add_feature(USCOUNTIES.with_scale('20m'), alpha=0.05)
-    lats, lons = latlon_coords(data)
+    lats, lons = cache.latlon(wrf_file)
+    # basemap, gridlines, etc. come from a per-process template, we only add the data layers here
+    render = get_render_context("map", to_np(lons), to_np(lats), extent)
+    fig, ax = render.begin()
+    # geojson-only frames never get drawn, so they don't pay for barbs and streamlines (the rasters that still get a PNG have neither)
+    if map_output == "geojson":
+        plot_barbs = plot_flow = lambda *args, **kwargs: None
+    else:
+        plot_barbs, plot_flow = plot_wind_barbs, plot_streamlines
     if product == 'temperature':
-        data_copy = (data_copy - 273.15) * 9/5 + 32
+        data_copy = convert(data_copy, 9/5, 32 - 273.15 * 9/5)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap='nipy_spectral', levels=np.arange(-10, 110, 5), extend='both')
         smooth_temp = smooth2d(data_copy, 4)
         ax.contour(to_np(lons), to_np(lats), to_np(smooth_temp), levels=[32], linestyles='dashed')
         plot_title = f"2m Temperature (°F) (32°F Dashed) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f"Temp (°F)"
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, cache=cache)
     elif product == '1hr_temp_c':
-        if partial_bool:
-            print(f'-> skipping {product} {timestep} due to partial flag being enabled')
-            return
         if timestep > 0:
-            temp_now = getvar(wrf_file, "T2", timeidx=timestep)
-            temp_prev = getvar(wrf_file, "T2", timeidx=timestep - 1)
-            temp_change_1hr = (temp_now - temp_prev) * 9/5
-            data_copy = temp_change_1hr.copy()
+            temp_change_1hr = get_window(cache, "T2").change(wrf_file, timestep, cache)
+            temp_change_1hr *= 9/5
+            data_copy = temp_change_1hr
         else:
             ax.annotate("This product starts on hour 1.", xy=(0.5, 0.5), xycoords='figure fraction', fontsize=8, color='black', ha='right', va='bottom', bbox=dict(facecolor='white', alpha=0.9, edgecolor='none'))
             temp_change_1hr = data_copy * 0
@@ -50,22 +69,18 @@ def plot_variable(product, variable, timestep, output_path, forecast_times, airp
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(temp_change_1hr), cmap="coolwarm", vmin=-10, vmax=10, extend='both')
         plot_title = f"1 Hour 2m Temp Change (°F) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f'Temperature Change (°F)'
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, cache=cache)
     elif product == 'dewp':
-        data_copy = data_copy * 9/5 + 32
+        data_copy = convert(data_copy, 9/5, 32)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap='BrBG', levels=np.arange(10, 85, 5), extend='both')
         plot_title = f"2m Dewpoint (°F) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f"Dewpoint (°F)"
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, cache=cache)
     elif product == '1hr_dewp_c':
-        if partial_bool:
-            print(f'-> skipping {product} {timestep} due to partial flag being enabled')
-            return
         if timestep > 0:
-            dewp_now = getvar(wrf_file, "td2", timeidx=timestep)
-            dewp_prev = getvar(wrf_file, "td2", timeidx=timestep - 1)
-            dewp_change_1hr = (dewp_now - dewp_prev) * 9/5
-            data_copy = dewp_change_1hr.copy()
+            dewp_change_1hr = get_window(cache, "td2").change(wrf_file, timestep, cache)
+            dewp_change_1hr *= 9/5
+            data_copy = dewp_change_1hr
         else:
             ax.annotate("This product starts on hour 1.", xy=(0.5, 0.5), xycoords='figure fraction', fontsize=8, color='black', ha='right', va='bottom', bbox=dict(facecolor='white', alpha=0.9, edgecolor='none'))
             dewp_change_1hr = data_copy * 0
@@ -73,154 +88,189 @@ def plot_variable(product, variable, timestep, output_path, forecast_times, airp
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(dewp_change_1hr), cmap="BrBG", vmin=-20, vmax=20, extend='both')
         plot_title = f"1 Hour 2m Dewpoint Change (°F) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f'Dewpoint Change (°F)'
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, cache=cache)
     elif product == 'rh':
         levels = np.arange(0, 100, 5)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap='BrBG', levels=levels, extend="max")
         plot_title = f"2m Relative Humidity (%) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f"Relative Humidity (%)"
     elif product == 'wind':
-        data_copy = data[0].copy()
-        data_copy = data_copy * 2.23694
+        data_copy = convert(data_copy[0], 2.23694)
         divnorm = colors.TwoSlopeNorm(vmin=0, vcenter=30, vmax=90)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap='YlOrRd', norm=divnorm)
         plot_title = f"10m Wind Speed (mph) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = "Wind Speed (mph)"
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats)
-        plot_streamlines(ax, wrf_file, timestep, lons, lats)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, cache=cache)
+        plot_flow(ax, wrf_file, timestep, lons, lats, cache=cache)
     elif product == 'wind_gust':
-        data_copy = data_copy * 2.23694
+        data_copy = convert(data_copy, 2.23694)
         divnorm = colors.TwoSlopeNorm(vmin=0, vcenter=50, vmax=110)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap='YlOrRd', norm=divnorm)
         plot_title = f"10m Wind Gust (mph) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f"Wind Max (mph)"
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats)
-        plot_streamlines(ax, wrf_file, timestep, lons, lats)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, cache=cache)
+        plot_flow(ax, wrf_file, timestep, lons, lats, cache=cache)
     elif product == 'comp_reflectivity':
-        refl_cmap = ctables.registry.get_colortable('NWSReflectivity')
+        refl_cmap = get_colortable('NWSReflectivity')
         data_masked = np.ma.masked_less(data_copy, 2)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_masked), cmap=refl_cmap, levels=np.arange(0, 75, 5), extend='max')
         plot_title = f"Composite Reflectivity (dbZ) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f"Composite Reflectivity (dbZ)"
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, cache=cache)
     elif product == 'total_precip':
-        data_copy = data_copy / 25.4
-        precip_cmap = ctables.registry.get_colortable('precipitation')
+        data_copy = convert(data_copy, 1 / 25.4)
+        precip_cmap = get_colortable('precipitation')
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap=precip_cmap, levels=np.arange(0, 20, 0.25), extend='max')
         plot_title = f"Total Precipitation (in) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f"Precipitation (in)"
     elif product == 'afwarain':
-        data_copy = data_copy / 25.4
+        data_copy = convert(data_copy, 1 / 25.4)
         data_copy = np.ma.masked_where(data_copy <= 0.01, data_copy)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap=get_truncated_cmap('Greens', min_val=0.2), levels=np.arange(0, 10, 0.25), extend='max')
         plot_title = f"Total Rainfall (in) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f"Rainfall (in)"
     elif product == 'afwasnow':
         snow_ratio = 10.0
-        data_copy = (data_copy / 25.4) * snow_ratio
+        data_copy = convert(data_copy, snow_ratio / 25.4)
         data_copy = np.ma.masked_where(data_copy <= 0.01, data_copy)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap=get_truncated_cmap('Blues', min_val=0.2), levels=np.arange(0, 15, 0.25), extend='max')
         plot_title = f"Total Snowfall (in) (10:1 ratio) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f"Snowfall (in)"
     elif product == 'afwasnow_k':
-        temp = getvar(wrf_file, "tk", timeidx=timestep) - 273.15
-        pressure = getvar(wrf_file, "pressure", timeidx=timestep)
-        snow_ratio = kuchera_ratio(temp, pressure)
-        data_copy = (data_copy / 25.4) * snow_ratio
+        data_copy = get_kuchera_snowfall(wrf_file, timestep, cache)
         data_copy = np.ma.masked_where(data_copy <= 0.01, data_copy)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap=get_truncated_cmap('Blues', min_val=0.2), levels=np.arange(0, 15, 0.25), extend='max')
         plot_title = f"Total Snowfall (in) (Kuchera ratio) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         ax.annotate(
-            f'Kuchera ratio is a work in progress and unfinished, with one big caveat:\n The Kuchera ratio for the *entire* total snowfall is recalculated at each step,\nmeaning values may not be fully indicative of actual snowfall.', xy=(0.01, 0.1), xycoords='axes fraction', fontsize=8, color='red', bbox=dict(facecolor='white', alpha=0.6, edgecolor='none'))
+            f'Kuchera ratio is a work in progress and unfinished.\nEach hour\'s new snow is converted with that hour\'s ratio and added to the total.', xy=(0.01, 0.1), xycoords='axes fraction', fontsize=8, color='red', bbox=dict(facecolor='white', alpha=0.6, edgecolor='none'))
         label = f"Snowfall (in)"
     elif product == 'afwafrz':
-        data_copy = data_copy / 25.4
+        data_copy = convert(data_copy, 1 / 25.4)
         data_copy = np.ma.masked_where(data_copy <= 0.01, data_copy)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap=get_truncated_cmap('RdPu', min_val=0.2), levels=np.arange(0, 3, 0.1), extend='max')
         plot_title = f"Total Freezing Rain (in) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f"Freezing Rain (in)"
     elif product == 'afwaslt':
-        data_copy = data_copy / 25.4
+        data_copy = convert(data_copy, 1 / 25.4)
         data_copy = np.ma.masked_where(data_copy <= 0.01, data_copy)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap=get_truncated_cmap('Oranges', min_val=0.2), levels=np.arange(0, 3, 0.1), extend='max')
         plot_title = f"Total Ice Fall (in) (liquid equiv.) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f"Ice Fall (in)"
-    elif product == '1hr_precip':
-        if partial_bool:
-            print(f'-> skipping {product} {timestep} due to partial flag being enabled')
-            return
-        rain_now = getvar(wrf_file, "AFWA_TOTPRECIP", timeidx=timestep)
-        rain_prev = getvar(wrf_file, "AFWA_TOTPRECIP", timeidx=timestep - 1) if timestep > 0 else rain_now * 0
-        precip_1hr = (rain_now - rain_prev) / 25.4
-        data_copy = precip_1hr.copy()
-        precip_cmap = ctables.registry.get_colortable('precipitation')
-        contour = ax.contourf(to_np(lons), to_np(lats), to_np(precip_1hr), cmap=precip_cmap, levels=np.arange(0, 5, 0.1), extend='max')
-        plot_title = f"1 Hour Precipitation (in) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
-        label = f'1 Hour Rainfall (in)'
+    elif product.endswith('hr_precip') and product_window(product):
+        # 1hr, 3hr, 6hr, 12hr, etc. all difference the same running total
+        window = product_window(product)
+        precip_window = get_window(cache, "AFWA_TOTPRECIP").change(wrf_file, timestep, cache, window)
+        precip_window /= 25.4
+        data_copy = precip_window
+        precip_cmap = get_colortable('precipitation')
+        levels = np.arange(0, 5, 0.1) if window == 1 else np.arange(0, 10, 0.25)
+        contour = ax.contourf(to_np(lons), to_np(lats), to_np(precip_window), cmap=precip_cmap, levels=levels, extend='max')
+        plot_title = f"{window} Hour Precipitation (in) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
+        label = f'{window} Hour Rainfall (in)'
     elif product == 'snowfall':
-        data_copy = data_copy / 25.4
+        data_copy = convert(data_copy, 1 / 25.4)
         divnorm = colors.TwoSlopeNorm(vmin=0, vcenter=1, vmax=10)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap='Blues', norm=divnorm, extend='max')
         plot_title = f"Total Accumulated Snowfall (in) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f"Accumulated Snowfall (in)"
     elif product == '1hr_snowfall':
-        if partial_bool:
-            print(f'-> skipping {product} {timestep} due to partial flag being enabled')
-            return
-        snow_now = getvar(wrf_file, "SNOWNC", timeidx=timestep)
-        snow_prev = getvar(wrf_file, "SNOWNC", timeidx=timestep - 1) if timestep > 0 else snow_now * 0
-        snow_1hr = (snow_now - snow_prev) / 25.4
-        data_copy = snow_1hr.copy()
+        snow_1hr = get_window(cache, "SNOWNC").change(wrf_file, timestep, cache)
+        snow_1hr /= 25.4
+        data_copy = snow_1hr
         divnorm = colors.TwoSlopeNorm(vmin=0, vcenter=0.3, vmax=3)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(snow_1hr), cmap='Blues', norm=divnorm, extend='max')
         plot_title = f"1 Hour Accumulated Snowfall (in) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f'Accumulated Snowfall'
     elif product == 'pressure':
-        data_copy = data_copy / 100
+        data_copy = convert(data_copy, 0.01)
         divnorm = colors.TwoSlopeNorm(vmin=970, vcenter=1013, vmax=1050)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap='bwr_r', norm=divnorm, extend='both')
         smooth_slp = smooth2d(data_copy, 8, cenweight=6)
         ax.contour(to_np(lons), to_np(lats), to_np(smooth_slp), colors="black", transform=ccrs.PlateCarree(), levels=np.arange(960, 1060, 4))
         plot_title = f"MSLP (mb) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f"MSLP (mb)"
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, cache=cache)
     elif product == 'echo_tops':
-        contour = ax.contourf(to_np(lons), to_np(lats), to_np(data), cmap='cividis_r', vmin=0, vmax=50000, extend='max')
+        contour = ax.contourf(to_np(lons), to_np(lats), data_copy, cmap='cividis_r', vmin=0, vmax=50000, extend='max')
         plot_title = f"Echo Tops (m) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f"Echo Tops (m)"
-    elif product == 'helicity':
-        helicity_sum = 0
-        for t in range(timestep + 1):  
-            helicity = getvar(wrf_file, "UP_HELI_MAX", timeidx=t)
-            helicity_sum += to_np(helicity)
-        reflectivity = getvar(wrf_file, "REFD_COM", timeidx=timestep)
+    elif product.startswith('helicity'):
+        # helicity, helicity_6hr, helicity_max, helicity_max_12hr, etc. - the track is carried forward hour to hour instead of re-summed
+        track_mode = "max" if "_max" in product else "sum"
+        window = int(product.split("_")[-1].replace("hr", "")) if product.endswith("hr") else None
+        track = cache.stage(f"helicity_{track_mode}", lambda: RunningTrack("UP_HELI_MAX", track_mode))
+        helicity_sum = track.total(wrf_file, timestep, cache, window)
+        # the track is what gets drawn, so it's what gets labelled and exported too
+        data_copy = helicity_sum
+        reflectivity = cache.array(wrf_file, "REFD_COM", timestep)
         reflectivity_masked = np.ma.masked_less(reflectivity, 2)
-        refl_cmap = ctables.registry.get_colortable("NWSReflectivity")
+        refl_cmap = get_colortable("NWSReflectivity")
         ax.contourf(to_np(lons), to_np(lats), to_np(reflectivity_masked), cmap=refl_cmap, levels=np.arange(0, 75, 5), alpha=0.3)
         contour = ax.contourf(to_np(lons), to_np(lats), helicity_sum, levels=[50, 100, 200, 300, 400, 500], colors=['green', 'cyan', 'blue', 'purple', 'red', 'black'], alpha=0.7)
         ax.contour(to_np(lons), to_np(lats), helicity_sum, levels=[50, 100, 200, 300, 400, 500], colors=['green', 'cyan', 'blue', 'purple', 'red', 'black'], linestyles='dashed')
-        plot_title = f"Helicity Tracks (m^2/s^2) + Comp. Reflectivity (dbZ, transparent) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
+        track_name = (f"{window}hr " if window else "") + ("Max Helicity" if track_mode == "max" else "Helicity")
+        plot_title = f"{track_name} Tracks (m^2/s^2) + Comp. Reflectivity (dbZ, transparent) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f'Helicity m^2/s^2'
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, cache=cache)
     elif product == 'cloudcover':
         low_cloud_frac = to_np(data_copy[0]) * 100 
         mid_cloud_frac = to_np(data_copy[1]) * 100
         high_cloud_frac = to_np(data_copy[2]) * 100
         total_cloud_frac = low_cloud_frac + mid_cloud_frac + high_cloud_frac
         data_copy = total_cloud_frac
-        contour = ax.pcolormesh(to_np(lons), to_np(lats), total_cloud_frac, cmap="Blues_r", norm=plt.Normalize(0, 100), transform=ccrs.PlateCarree())
+        contour = draw_raster(ax, total_cloud_frac, lons, lats, "Blues_r", plt.Normalize(0, 100))
         plot_title = f"Cloud Cover - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f'Cloud Fraction (%)'
     elif product == 'mcape':
-        data_copy = data[0].copy()
+        data_copy = data_copy[0]
         label = f'CAPE (J/kg)'
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap='magma_r', vmin=0, vmax=6000)
         plot_title = f"Max CAPE (MU 500m Parcel) (J/kg) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
     elif product == 'mcin':
-        data_copy = data[1].copy()
+        data_copy = data_copy[1]
         label = f'CIN (J/kg)'
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap='magma_r', vmin=0, vmax=6000)
         plot_title = f"Max CIN (MU 500m Parcel) (J/kg) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
+    elif product == 'srh_1km' or product == 'srh_3km':
+        depth = 1 if product == 'srh_1km' else 3
+        data_copy = kinematic_parameters(wrf_file, timestep, cache)[product]
+        contour = ax.contourf(to_np(lons), to_np(lats), data_copy, cmap='RdPu', levels=[0, 50, 100, 150, 200, 250, 300, 400, 500, 600, 800], extend='max')
+        plot_title = f"0-{depth}km Storm Relative Helicity (m^2/s^2) (Bunkers Right Mover) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
+        label = f'SRH (m^2/s^2)'
+        plot_barbs(ax, wrf_file, timestep, lons, lats, cache=cache)
+    elif product == 'shear_6km':
+        data_copy = kinematic_parameters(wrf_file, timestep, cache)[product]
+        contour = ax.contourf(to_np(lons), to_np(lats), data_copy, cmap='PuBuGn', levels=np.arange(0, 85, 5), extend='max')
+        plot_title = f"0-6km Bulk Shear (kt) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
+        label = f'Bulk Shear (kt)'
+        plot_barbs(ax, wrf_file, timestep, lons, lats, cache=cache)
+    elif product == 'lifted_index':
+        data_copy = stability_indices(wrf_file, timestep, cache)[product]
+        contour = ax.contourf(to_np(lons), to_np(lats), data_copy, cmap='RdBu', levels=np.arange(-12, 13, 1), extend='both')
+        plot_title = f"Surface Based Lifted Index (°C) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
+        label = f'Lifted Index (°C)'
+    elif product == 'k_index':
+        data_copy = stability_indices(wrf_file, timestep, cache)[product]
+        contour = ax.contourf(to_np(lons), to_np(lats), data_copy, cmap='YlOrRd', levels=np.arange(15, 46, 2), extend='both')
+        plot_title = f"K Index - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
+        label = f'K Index'
+    elif product == 'total_totals':
+        data_copy = stability_indices(wrf_file, timestep, cache)[product]
+        contour = ax.contourf(to_np(lons), to_np(lats), data_copy, cmap='YlOrRd', levels=np.arange(40, 62, 1), extend='both')
+        plot_title = f"Total Totals Index - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
+        label = f'Total Totals'
+    elif product == 'stp':
+        data_copy = composite_parameters(wrf_file, timestep, cache)[product]
+        contour = ax.contourf(to_np(lons), to_np(lats), data_copy, cmap='magma_r', levels=[0.5, 1, 2, 3, 4, 6, 8, 10], extend='max')
+        plot_title = f"Significant Tornado Parameter (Fixed Layer, MU CAPE) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
+        label = f'STP'
+        plot_barbs(ax, wrf_file, timestep, lons, lats, cache=cache)
+    elif product == 'scp':
+        data_copy = composite_parameters(wrf_file, timestep, cache)[product]
+        contour = ax.contourf(to_np(lons), to_np(lats), data_copy, cmap='magma_r', levels=[1, 2, 4, 6, 8, 10, 15, 20], extend='max')
+        plot_title = f"Supercell Composite Parameter (0-3km SRH, 0-6km Shear) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
+        label = f'SCP'
+        plot_barbs(ax, wrf_file, timestep, lons, lats, cache=cache)
     elif product.startswith("temp") and level != None:
         cmax, cmin = None, None
         contour_freezing = False
@@ -244,7 +294,7 @@ def plot_variable(product, variable, timestep, output_path, forecast_times, airp
         else:
             plot_title = f"{level}mb Temp (°C) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f'Temp (°C)'
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats, level)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, level, cache)
     elif product.startswith("td") and level != None:
         cmax, cmin = None, None
         if level == 850:
@@ -258,7 +308,7 @@ def plot_variable(product, variable, timestep, output_path, forecast_times, airp
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap='BrBG', levels=np.arange(cmin, cmax, 2), extend='both')
         plot_title = f"{level}mb Dew Point (°C) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f'Dew Point (°C)'
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats, level)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, level, cache)
     elif product.startswith("rh") and level != None:
         levels = np.arange(0, 100, 5)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap='BrBG', levels=levels, extend='max')
@@ -275,10 +325,10 @@ def plot_variable(product, variable, timestep, output_path, forecast_times, airp
             levels = np.linspace(np.nanmin(data_copy), np.nanmax(data_copy), 20)
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap='turbo', levels=levels, extend='both')
         plot_title = f"{level}mb Theta E (K) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats, level)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, level, cache)
         label = f'Theta E (K)'
     elif product.startswith("wind") and level != None:
-        va = interplevel(getvar(wrf_file, "va", timeidx=timestep), pressure, level)
+        va = cache.array(wrf_file, "va", timestep, level)
         ws = np.sqrt(to_np(data_copy)**2 + to_np(va)**2) * 1.944
         data_copy = ws
         cmax = None
@@ -286,11 +336,11 @@ def plot_variable(product, variable, timestep, output_path, forecast_times, airp
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(ws), cmap="plasma", vmax=cmax)
         plot_title = f"{level}mb Wind Speed (kt) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f'Wind Speed (kt)'
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats, level)
-        plot_streamlines(ax, wrf_file, timestep, lons, lats, level)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, level, cache)
+        plot_flow(ax, wrf_file, timestep, lons, lats, level, cache)
     elif product.startswith("height") and level != None:
         cmax, cmin = None, None
-        data_copy = data_copy / 10
+        data_copy = convert(data_copy, 0.1)
         if level == 700:
             cmax, cmin = 350, 250
         elif level == 500:
@@ -300,18 +350,11 @@ def plot_variable(product, variable, timestep, output_path, forecast_times, airp
         ax.contour(to_np(lons), to_np(lats), to_np(smooth_z), colors="black", transform=ccrs.PlateCarree(), levels=np.arange(100, 1000, 5))
         plot_title = f"{level}mb Height (dam) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f'Height (dam)'
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats, level)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, level, cache)
     elif product.startswith('1hr_temp_c') and level != None:
-        if partial_bool:
-            print(f'-> skipping {product} {timestep} due to partial flag being enabled')
-            return
         if timestep > 0:
-            temp_now = getvar(wrf_file, "tc", timeidx=timestep)
-            temp_prev = getvar(wrf_file, "tc", timeidx=timestep - 1)
-            upper_temp_now = interplevel(temp_now, pressure, level)
-            upper_temp_prev = interplevel(temp_prev, pressure, level)
-            temp_change_1hr = (upper_temp_now - upper_temp_prev)
-            data_copy = temp_change_1hr.copy()
+            temp_change_1hr = get_window(cache, "tc", level).change(wrf_file, timestep, cache)
+            data_copy = temp_change_1hr
         else:
             ax.annotate("This product starts on hour 1.", xy=(0.5, 0.5), xycoords='figure fraction', fontsize=8, color='black', ha='right', va='bottom', bbox=dict(facecolor='white', alpha=0.9, edgecolor='none'))
             temp_change_1hr = data_copy * 0
@@ -319,7 +362,7 @@ def plot_variable(product, variable, timestep, output_path, forecast_times, airp
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(temp_change_1hr), cmap="coolwarm", vmin=-15, vmax=15)
         plot_title = f"1-Hour {level}mb Temp Change (°C) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f'Temperature Change (°C)'
-        plot_wind_barbs(ax, wrf_file, timestep, lons, lats, level)
+        plot_barbs(ax, wrf_file, timestep, lons, lats, level, cache)
     elif product == 'stargazing':
         #wip
         low_clear_frac = 1.0 - to_np(data_copy[0])
@@ -327,37 +370,29 @@ def plot_variable(product, variable, timestep, output_path, forecast_times, airp
         high_clear_frac = 1.0 - to_np(data_copy[2])
         total_cloud_frac = 1.0 - (low_clear_frac * mid_clear_frac * high_clear_frac)
         clear_sky_score = 1.0 - (total_cloud_frac)
-        pwat = getvar(wrf_file, "AFWA_PWAT", timeidx=timestep)
+        pwat = cache.array(wrf_file, "AFWA_PWAT", timestep)
         transparency_score = np.clip(1.0 - (to_np(pwat) / 30.0), 0.0, 1.0)
-        u_300 = interplevel(getvar(wrf_file, "ua", timeidx=timestep), getvar(wrf_file, "pressure", timeidx=timestep), 300)
-        v_300 = interplevel(getvar(wrf_file, "va", timeidx=timestep), getvar(wrf_file, "pressure", timeidx=timestep), 300)
+        u_300 = cache.array(wrf_file, "ua", timestep, 300)
+        v_300 = cache.array(wrf_file, "va", timestep, 300)
         wind_speed_300 = np.sqrt(to_np(u_300)**2 + to_np(v_300)**2)
         seeing_score = np.clip(1.0 - (wind_speed_300 / 70.0), 0.0, 1.0)
-        wind_10m = getvar(wrf_file, "wspd_wdir10", timeidx=timestep)[0]
+        wind_10m = cache.array(wrf_file, "wspd_wdir10", timestep)[0]
         wind_10m_penalty = np.where(to_np(wind_10m) > 8.0, 0.7, 1.0)
-        rh2 = getvar(wrf_file, "rh2", timeidx=timestep)
+        rh2 = cache.array(wrf_file, "rh2", timestep)
         rh2_penalty = np.where(to_np(rh2) > 85.0, 0.7, 1.0)
         index = (clear_sky_score * 75) + (transparency_score * 15) + (seeing_score * 10)
         index = np.clip(index * wind_10m_penalty * rh2_penalty, 0, 100)
-        contour = ax.contourf(to_np(lons), to_np(lats), index, cmap="RdYlGn", levels=np.arange(0, 105, 5), extend='both')
+        contour = draw_raster(ax, index, lons, lats, *contour_colors("RdYlGn", np.arange(0, 105, 5)))
         data_copy = index
         plot_title = f"Lobdell Stargazing Index (0-100) - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         ax.annotate(f'Index Explanation:\n75% Clear Sky\n15% Atmospheric Transparency\n10% Seeing Conditions\nPenalties for High Sfc. RH and Wind', xy=(0.01, 0.1), xycoords='axes fraction', fontsize=6, color='black', bbox=dict(facecolor='white', alpha=0.6, edgecolor='none'))
         label = f'Index (100=Clear/Dry)'
     elif product == 'ptype':
-        if partial_bool:
-            print(f'-> skipping {product} {timestep} due to partial flag being enabled')
-            return
-        if timestep > 0:
-            rain = getvar(wrf_file, "AFWA_RAIN", timeidx=timestep) - getvar(wrf_file, "AFWA_RAIN", timeidx=timestep - 1)
-            snow = getvar(wrf_file, "AFWA_SNOW", timeidx=timestep) - getvar(wrf_file, "AFWA_SNOW", timeidx=timestep - 1)
-            ice  = getvar(wrf_file, "AFWA_ICE",  timeidx=timestep) - getvar(wrf_file, "AFWA_ICE",  timeidx=timestep - 1)
-            fzra = getvar(wrf_file, "AFWA_FZRA", timeidx=timestep) - getvar(wrf_file, "AFWA_FZRA", timeidx=timestep - 1)
-        else:
-            rain = getvar(wrf_file, "AFWA_RAIN", timeidx=timestep)
-            snow = getvar(wrf_file, "AFWA_SNOW", timeidx=timestep)
-            ice  = getvar(wrf_file, "AFWA_ICE",  timeidx=timestep)
-            fzra = getvar(wrf_file, "AFWA_FZRA", timeidx=timestep)
+        # the last hour's worth of each type (hour 0 is just its total so far)
+        rain = get_window(cache, "AFWA_RAIN").change(wrf_file, timestep, cache)
+        snow = get_window(cache, "AFWA_SNOW").change(wrf_file, timestep, cache)
+        ice  = get_window(cache, "AFWA_ICE").change(wrf_file, timestep, cache)
+        fzra = get_window(cache, "AFWA_FZRA").change(wrf_file, timestep, cache)
         precip_types = np.array([to_np(snow), to_np(ice), to_np(fzra), to_np(rain)])
         type_id = np.argmax(precip_types, axis=0)
         total_rate = np.sum(precip_types, axis=0)
@@ -367,10 +402,7 @@ def plot_variable(product, variable, timestep, output_path, forecast_times, airp
         ptype_data = (type_id * 3) + intensity + 1  
         ptype_data[total_rate < 0.1] = 0
         data_copy = ptype_data.copy()
-        cmap = colors.ListedColormap(['white', 'skyblue', 'deepskyblue', 'blue', 'peachpuff', 'orange', 'darkorange', 'lightpink', 'hotpink', 'deeppink', 'lightgreen', 'green', 'darkgreen'])
-        bounds = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13]
-        norm = colors.BoundaryNorm(bounds, cmap.N)
-        mesh = ax.pcolormesh(to_np(lons), to_np(lats), ptype_data, cmap=cmap, norm=norm, transform=ccrs.PlateCarree())
+        mesh = draw_raster(ax, ptype_data, lons, lats, PTYPE_CMAP, PTYPE_NORM)
         plot_title = f"Potential Precipitation Type and Intensity - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
         label = f'Precipitation Type'
         cbar = fig.colorbar(mesh, ax=ax, location="right", fraction=0.035, pad=0.02, shrink=0.85, aspect=25, ticks=[0, 1, 2, 3, 4])
@@ -378,32 +410,44 @@ def plot_variable(product, variable, timestep, output_path, forecast_times, airp
         ax.annotate(f'P-TYPE IS A WORK IN PROGRESS!\nIntensity Breakpoints (Liquid Eq.):\nHeavy - 7.6mm/hr\nModerate - 2.5mm/hr\nLight - <2.5mm/hr', xy=(0.01, 0.1), xycoords='axes fraction', fontsize=8, color='red', bbox=dict(facecolor='white', alpha=0.6, edgecolor='none'))
     else:
         contour = ax.contourf(to_np(lons), to_np(lats), to_np(data_copy), cmap='coolwarm')
-        plot_title = f"Unconfigured product: {data.description} - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
-        label = f"{data.description}"
+        # the one place the DataArray's metadata is wanted. level stack fields are plain arrays without any
+        description = getattr(cache.get(wrf_file, variable, timestep, level), "description", variable)
+        plot_title = f"Unconfigured product: {description} - Hour {f_hour}\nValid: {valid_time_str}\nInit: {init_str}"
+        label = f"{description}"
+    frame_name = f"hour_{f_hour}" if loc is None else f"hour_{f_hour}_{loc}"
+    artist = mesh if product == "ptype" else contour
+    if export_field:
+        # the values behind the frame, for the site to colorize and probe itself (see export.py)
+        write_frame(os.path.join(output_path, f"{frame_name}.bin"), data_copy, artist, label)
+        write_grid(os.path.join(os.path.dirname(output_path), "grid.bin"), lats, lons)
+    if map_output != "png" and isinstance(artist, ContourSet):
+        # the polygons contourf just worked out, as GeoJSON (see contours.py). rasters (cloudcover, ptype, ...) have none
+        write_contours(os.path.join(output_path, f"{frame_name}.geojson"), artist, label, contour_tolerance)
+    if map_output == "geojson" and isinstance(artist, ContourSet):
+        # vectors only: no colorbar, labels or PNG. rasters have no contours to write, so they still get their PNG
+        render.finish()
+        print(f'-> {product} hr {f_hour} contours')
+        return True
     if product != ("ptype"):
         cbar = fig.colorbar(contour, ax=ax, location="right", fraction=0.035, pad=0.02, shrink=0.85, aspect=25)
-    gl = ax.gridlines(crs=ccrs.PlateCarree(), draw_labels=True, linewidth=0.5, color='gray', alpha=0.5, linestyle='--')
-    gl.top_labels = False; gl.right_labels = False
-    ax.coastlines()
-    ax.add_feature(cfeature.BORDERS, linewidth=0.5)
-    ax.add_feature(cfeature.STATES.with_scale('50m'))
     if product != ("cloudcover") and product != ("ptype"):
-        try:
+        # zoomed-in maps only label the stations inside their extent, and with a bigger font
+        if extent is not None:
             west, east, north, south = extent
-            for airport, (lat, lon) in airports.items():
-                if not (west <= lon <= east and south <= lat <= north):
-                    continue
-                idx_x, idx_y = ll_to_xy(wrf_file, lat, lon)
-                value = to_np(data_copy)[idx_y, idx_x]
-                ax.text(lon, lat, f"{value:.1f}", color='black', fontsize=14, ha='center', va='bottom', bbox=dict(facecolor='white', alpha=0.2, edgecolor='none', boxstyle='round'))
-        except:
-            try:
-                for airport, (lat, lon) in airports.items():
-                    idx_x, idx_y = ll_to_xy(wrf_file, lat, lon)
-                    value = to_np(data_copy)[idx_y, idx_x]
-                    ax.text(lon, lat, f"{value:.1f}", color='black', fontsize=12, ha='center', va='bottom', bbox=dict(facecolor='white', alpha=0.2, edgecolor='none', boxstyle='round'))
-            except:
-                pass
+            labelled = [(lat, lon) for lat, lon in airports.values() if west <= lon <= east and south <= lat <= north]
+            fontsize = 14
+        else:
+            labelled = list(airports.values())
+            fontsize = 12
+        stations = get_station_index(wrf_file, cache)
+        idx_x, idx_y = stations.indices(labelled)
+        on_grid = stations.inside(idx_x, idx_y)
+        values = to_np(data_copy)[idx_y[on_grid], idx_x[on_grid]]
+        # stations under the ground at this level (masked) don't get a label
+        for (lat, lon), value, missing in zip([c for c, ok in zip(labelled, on_grid) if ok], np.ma.getdata(values), np.ma.getmaskarray(values)):
+            if missing or not np.isfinite(value):
+                continue
+            ax.text(lon, lat, f"{value:.1f}", color='black', fontsize=fontsize, ha='center', va='bottom', bbox=dict(facecolor='white', alpha=0.2, edgecolor='none', boxstyle='round'))
     if product != ("cloudcover") and product != ("ptype"):
         maxmin = ""
         max_value = to_np(data_copy).max()
@@ -416,45 +460,45 @@ def plot_variable(product, variable, timestep, output_path, forecast_times, airp
     ax.set_title(plot_title, fontweight='bold', loc='left')
     ax.annotate(f"UGA-WRF Run {run_time}", xy=(0.01, 0.01), xycoords='axes fraction', fontsize=8, color='black')
     os.makedirs(output_path, exist_ok=True)
-    if loc is None:
-        fig.savefig(os.path.join(output_path, f"hour_{f_hour}.png"), bbox_inches='tight', dpi=125)
-    else:
-        fig.savefig(os.path.join(output_path, f"hour_{f_hour}_{loc}.png"), bbox_inches='tight', dpi=125)
-    plt.close(fig)
+    # drawn once here, encoded and written by the image writer's threads while the next frame renders
+    save_frame(fig, os.path.join(output_path, frame_name), product)
+    render.finish()
     print(f'-> {product} hr {f_hour} with {extent}')
+    return True
 
-def plot_wind_barbs(ax, wrf_file, timestep, lons, lats, pressure_level=None):
+def product_window(product):
+    # 1hr_temp_c, 3hr_precip, 1hr_temp_c_850mb, etc. -> the window length in hours, None for everything else
+    head = product.split("_")[0]
+    if head.endswith("hr") and head[:-2].isdigit():
+        return int(head[:-2])
+    return None
+
+def get_wind(wrf_file, timestep, pressure_level, cache):
+    # u/v at pressure_level, or 10m if there isn't one
     if pressure_level:
-        u = getvar(wrf_file, "ua", timeidx=timestep)
-        v = getvar(wrf_file, "va", timeidx=timestep)
-        pressure = getvar(wrf_file, "pressure", timeidx=timestep)
-        u_interp = interplevel(u, pressure, pressure_level)
-        v_interp = interplevel(v, pressure, pressure_level)
-    else:
-        u_interp = getvar(wrf_file, "U10", timeidx=timestep)
-        v_interp = getvar(wrf_file, "V10", timeidx=timestep)
+        return cache.array(wrf_file, "ua", timestep, pressure_level), cache.array(wrf_file, "va", timestep, pressure_level)
+    return cache.array(wrf_file, "U10", timestep), cache.array(wrf_file, "V10", timestep)
+
+def plot_wind_barbs(ax, wrf_file, timestep, lons, lats, pressure_level=None, cache=None):
+    if cache is None:
+        cache = FieldCache()
+    u_interp, v_interp = get_wind(wrf_file, timestep, pressure_level, cache)
     stride = 40
     ax.barbs(to_np(lons[::stride, ::stride]), to_np(lats[::stride, ::stride]),
              to_np(u_interp[::stride, ::stride]), to_np(v_interp[::stride, ::stride]),
              length=6, color='black', pivot='middle',
              barb_increments={'half': 2.57222, 'full': 5.14444, 'flag': 25.7222})
 
-def plot_streamlines(ax, wrf_file, timestep, lons, lats, pressure_level=None):
-    if pressure_level:
-        u = getvar(wrf_file, "ua", timeidx=timestep)
-        v = getvar(wrf_file, "va", timeidx=timestep)
-        pressure = getvar(wrf_file, "pressure", timeidx=timestep)
-        u_interp = interplevel(u, pressure, pressure_level)
-        v_interp = interplevel(v, pressure, pressure_level)
-    else:
-        u_interp = getvar(wrf_file, "U10", timeidx=timestep)
-        v_interp = getvar(wrf_file, "V10", timeidx=timestep)
-    ds = 4
-    lon2 = to_np(lons)[::ds, ::ds]
-    lat2 = to_np(lats)[::ds, ::ds]
-    u2 = to_np(u_interp)[::ds, ::ds]
-    v2 = to_np(v_interp)[::ds, ::ds]
-    ax.streamplot(lon2, lat2, u2, v2, density=0.75, color='k', linewidth=1)
+def plot_streamlines(ax, wrf_file, timestep, lons, lats, pressure_level=None, cache=None):
+    if cache is None:
+        cache = FieldCache()
+    # traced once per level/hour/map view and shared by every product that draws them (see streamlines.py)
+    def compute():
+        u_interp, v_interp = get_wind(wrf_file, timestep, pressure_level, cache)
+        ds = 4
+        return trace_streamlines(ax.projection, ax.get_extent(ax.projection), to_np(lons)[::ds, ::ds], to_np(lats)[::ds, ::ds],
+                                 to_np(u_interp)[::ds, ::ds], to_np(v_interp)[::ds, ::ds], density=0.75)
+    draw_streamlines(ax, cache.derived("streamlines", timestep, compute, view_tag(ax, pressure_level)), color='k', linewidth=1)
 
 def kuchera_ratio(temp, pres):
     #thanks random website on the internet for giving me what i think is the kuchera ratio formula
@@ -464,6 +508,43 @@ def kuchera_ratio(temp, pres):
     ratio = np.where(t_max > threshold, 12 + (2 * (threshold - t_max)), 12 + (threshold - t_max))
     return np.clip(ratio, 0, 30)
 
+def get_kuchera_ratio(wrf_file, timestep, cache):
+    # afwasnow_k and the 4 panel ptype both want this, so only work it out once per timestep
+    def compute():
+        pressure = to_np(cache.get(wrf_file, "pressure", timestep))
+        # only the model levels that are below 500mb somewhere in the domain can matter, and tc is already around for the level stack
+        top = max(int(np.count_nonzero((pressure >= 500).any(axis=(1, 2)))), 1)
+        temp = to_np(cache.get(wrf_file, "tc", timestep))[:top]
+        return kuchera_ratio(temp, pressure[:top])
+    return cache.derived("kuchera_ratio", timestep, compute)
+
+def kuchera_increment(wrf_file, timestep, cache):
+    # this hour's new snow (in) at this hour's ratio
+    new_snow = get_window(cache, "AFWA_SNOW").change(wrf_file, timestep, cache)
+    new_snow *= get_kuchera_ratio(wrf_file, timestep, cache) / 25.4
+    return new_snow
+
+def get_kuchera_snowfall(wrf_file, timestep, cache):
+    # storm total snowfall (in), built up one hour at a time and carried forward instead of re-ratioing the whole total every hour
+    track = cache.stage("kuchera_snowfall", lambda: RunningTrack("AFWA_SNOW", field=kuchera_increment))
+    return track.total(wrf_file, timestep, cache)
+
+def kuchera_totals(wrf_file, hours, cache):
+    # every hour's storm total in one walk through the run, for the parent to hand its render workers (see renderpool.py)
+    totals = []
+    for t in range(hours):
+        totals.append(np.asarray(get_kuchera_snowfall(wrf_file, t, cache), dtype=np.float32))
+        # the 3d tc/pressure behind the ratio aren't needed again here
+        cache.drop_timestep(t)
+    return np.stack(totals)
+
+def seed_kuchera_snowfall(cache, totals):
+    # hands the track every hour's total up front, so a worker never walks the run's 3d ratios itself
+    track = cache.stage("kuchera_snowfall", lambda: RunningTrack("AFWA_SNOW", field=kuchera_increment))
+    track.keep = len(totals) + 1
+    track.totals = dict(enumerate(totals))
+
+@functools.lru_cache(maxsize=None)
 def get_truncated_cmap(cmap_name, min_val=0.2, max_val=1.0):
     cmap = plt.get_cmap(cmap_name)
     color = cmap(np.linspace(min_val, max_val, 256))
@@ -12,7 +12,18 @@ const products = {
     "mcape": "Max CAPE",
     "mcin": "Max CIN",
     "helicity": "Helicity",
+    "srh_1km": "0-1km Storm Relative Helicity",
+    "srh_3km": "0-3km Storm Relative Helicity",
+    "shear_6km": "0-6km Bulk Shear",
+    "lifted_index": "Lifted Index",
+    "k_index": "K Index",
+    "total_totals": "Total Totals",
+    "stp": "Significant Tornado Parameter",
+    "scp": "Supercell Composite Parameter",
     "1hr_precip": "1-Hour Precipitation",
+    "3hr_precip": "3-Hour Precipitation",
+    "6hr_precip": "6-Hour Precipitation",
+    "12hr_precip": "12-Hour Precipitation",
     "total_precip": "Total Precipitation",
     "1hr_snowfall": "1-Hour Snowfall",
     "snowfall": "Snowfall",
@@ -50,6 +61,8 @@ const outputs = "https://storage.googleapis.com/uga-wrf-website/outputs/";
 const hours = 48;
 let timestep = 0;
 let product = "temperature";
+// products the run saved as something other than png (see imagewriter.py), from metadata.json
+let extensions = {};
 const slider = document.getElementById('timeSlider');
 const runSelector = document.getElementById('runSelector');
 const domainSelector = document.getElementById('domainSelector');
@@ -133,7 +146,7 @@ function updateImage(selectedProduct = product) {
     const domain = domainSelector.value;
     timestep = Number(slider.value);
     timeLabel.textContent = `Hour ${timestep}/${hours}`;
-    weatherImage.src = `${outputs}${run}/${domain}/${product}/hour_${timestep}.png`;
+    weatherImage.src = `${outputs}${run}/${domain}/${product}/hour_${timestep}.${extensions[product] || "png"}`;
     weatherImage.onerror = () => {
         weatherImage.src = "/Frame_Unavailable.png";
     }
@@ -156,7 +169,7 @@ function updateSecondaryDisplay() {
     const subchoosed = multiSubchooser.value
     timestep = Number(slider.value);
     if (multiSelector.value == 'map')
-        secondaryImage.src = `${outputs}${run}/${domain}/${subchoosed}/hour_${timestep}.png`
+        secondaryImage.src = `${outputs}${run}/${domain}/${subchoosed}/hour_${timestep}.${extensions[subchoosed] || "png"}`
     else if (multiSelector.value == 'skewt')
         secondaryImage.src = `${outputs}${run}/${domain}/skewt/${subchoosed}/hour_${timestep}.png`
 }
@@ -296,6 +309,11 @@ async function checkRunStatus() {
         if (response.ok) {
             const data = await response.json();
             console.log(data)
+            const previous = JSON.stringify(extensions);
+            extensions = data.image_extensions || {};
+            if (JSON.stringify(extensions) !== previous) {
+                updateImage();
+            }
             if (data.in_progress === true) {
                 statusElement.textContent = "Model run in-progress/unfinished - not all frames or products will be available";
             } 